@@ -0,0 +1,107 @@
+# async_utils.py
+
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class MicroBatcher:
+    """
+    Собирает одиночные запросы, пришедшие в течение короткого окна,
+    в один пакетный вызов и раздает результаты ожидающим.
+
+    batch_func(group, keys) должна вернуть словарь key -> результат;
+    ключи, которых нет в ответе, получают None.
+    Запросы из разных групп (например, с разным набором part) не смешиваются.
+    """
+
+    def __init__(self, batch_func: Callable[[Hashable, list], Awaitable[dict]],
+                 window: float, max_batch: int = 50):
+        self._batch_func = batch_func
+        self._window = window
+        self._max_batch = max_batch
+        self._pending: dict[Hashable, dict[Hashable, list[asyncio.Future]]] = {}
+        self._timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batches_sent = 0
+        self.keys_requested = 0
+
+    async def submit(self, key: Hashable, group: Hashable = None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(group, {})
+        pending.setdefault(key, []).append(future)
+        self.keys_requested += 1
+
+        if len(pending) >= self._max_batch:
+            self._flush(group)
+        elif group not in self._timers:
+            self._timers[group] = loop.call_later(self._window, self._flush, group)
+        return await future
+
+    def _flush(self, group: Hashable) -> None:
+        timer = self._timers.pop(group, None)
+        if timer:
+            timer.cancel()
+        batch = self._pending.pop(group, None)
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(group, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, group: Hashable, batch: dict) -> None:
+        self.batches_sent += 1
+        try:
+            results = await self._batch_func(group, list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results.get(key))
+
+
+class SingleFlight:
+    """
+    Дедупликация одинаковых запросов, выполняющихся одновременно:
+    все вызовы do() с одним ключом ждут одну и ту же корутину и получают ее результат.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable]):
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self.collapsed += 1
+        # shield: отмена одного из ожидающих не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Помечаем исключение как полученное, даже если все ожидающие отменены
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "collapsed": self.collapsed}
+
+
+async def with_deadline(coro: Awaitable, timeout: float, default=None):
+    """Ждет корутину не дольше timeout секунд; по истечении срока возвращает default."""
+    try:
+        return await asyncio.wait_for(coro, timeout)
+    except asyncio.TimeoutError:
+        return default
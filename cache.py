@@ -0,0 +1,256 @@
+# cache.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Hashable
+
+# Как часто (секунды) отметки о чтении записей кэша API сбрасываются на диск
+ACCESS_FLUSH_INTERVAL = 30
+
+
+class TTLCache:
+    """
+    Простой LRU-кэш в памяти с временем жизни записей.
+    Размер ограничен количеством записей: при переполнении вытесняется
+    запись, к которой дольше всего не обращались.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{self.hits / total * 100:.1f}" if total else "0.0"
+        }
+
+
+class ApiCache:
+    """
+    Двухуровневый кэш ответов API: LRU в памяти перед SQLite-базой на диске.
+    Диск переживает перезапуски контейнера, память избавляет от чтения с диска.
+
+    Записи хранятся вместе со сроком годности и ETag. Просроченные записи не удаляются
+    сразу: get() возвращает их как есть (см. is_fresh), чтобы их можно было
+    перепроверить условным запросом. Место освобождается вытеснением:
+    в памяти — по количеству записей, на диске — по суммарному размеру (LRU).
+
+    Диск не трогается из event loop: чтение идет в потоке (asyncio.to_thread),
+    а записи, продления и отметки о чтении копятся в памяти и сбрасываются
+    фоновым потоком одной транзакцией (отметки о чтении — не чаще раза в ACCESS_FLUSH_INTERVAL).
+    """
+
+    def __init__(self, db_path: str, memory_items: int, disk_max_bytes: int):
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: OrderedDict[str, dict] = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS api_cache ("
+            " key TEXT PRIMARY KEY,"
+            " expires_at REAL NOT NULL,"
+            " etag TEXT,"
+            " payload TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_api_cache_accessed ON api_cache (accessed_at);"
+        )
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM api_cache").fetchone()[0]
+
+        # Еще не записанное на диск: key -> запись, key -> новый срок годности, key -> время чтения
+        self._writes: dict[str, dict] = {}
+        self._touches: dict[str, float] = {}
+        self._accessed: dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._flush_pending = False
+        self._flush_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-cache-flush")
+
+    @staticmethod
+    def is_fresh(entry: dict | None) -> bool:
+        return entry is not None and entry['expires_at'] > time.time()
+
+    def _remember(self, key: str, entry: dict) -> None:
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _schedule_flush(self) -> None:
+        """Запускает сброс на диск в фоне, если есть что писать. Вызывается под self._lock."""
+        if self._flush_pending:
+            return
+        if not (self._writes or self._touches or
+                (self._accessed and time.monotonic() - self._last_flush >= ACCESS_FLUSH_INTERVAL)):
+            return
+        self._flush_pending = True
+        self._flush_executor.submit(self.flush)
+
+    def _read_disk(self, key: str) -> dict | None:
+        with self._lock:
+            # Запись могла еще не дойти до диска
+            entry = self._writes.get(key)
+            if entry is not None:
+                return entry
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT expires_at, etag, payload FROM api_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            self._accessed[key] = time.time()
+            self._schedule_flush()
+            expires_at = self._touches.get(key, row[0])
+        return {"expires_at": expires_at, "etag": row[1], "payload": json.loads(row[2])}
+
+    async def get(self, key: str) -> dict | None:
+        """Запись {'payload', 'etag', 'expires_at'} или None. Запись может быть просроченной."""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            if self.is_fresh(entry):
+                self.memory_hits += 1
+            return entry
+
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if self.is_fresh(entry):
+            self.disk_hits += 1
+        self._remember(key, entry)
+        return entry
+
+    def set(self, key: str, payload: dict, ttl: float, etag: str | None = None) -> None:
+        self.set_many({key: payload}, ttl, etag=etag)
+
+    def set_many(self, payloads: dict[str, dict], ttl: float, etag: str | None = None) -> None:
+        """Кладет несколько записей сразу: на диск они попадут одной транзакцией."""
+        expires_at = time.time() + ttl
+        with self._lock:
+            for key, payload in payloads.items():
+                entry = {"expires_at": expires_at, "etag": etag, "payload": payload}
+                self._remember(key, entry)
+                self._writes[key] = entry
+                self._touches.pop(key, None)
+            self._schedule_flush()
+
+    def touch(self, key: str, ttl: float) -> None:
+        """Продлевает срок годности записи, не перезаписывая ее (ответ 304 Not Modified)."""
+        expires_at = time.time() + ttl
+        entry = self._memory.get(key)
+        if entry is not None:
+            entry['expires_at'] = expires_at
+        with self._lock:
+            if key in self._writes:
+                self._writes[key]['expires_at'] = expires_at
+            else:
+                self._touches[key] = expires_at
+            self._schedule_flush()
+        self.revalidated += 1
+
+    def flush(self) -> None:
+        """Записывает накопленные изменения одной транзакцией (синхронно; при остановке бота вызывается напрямую)."""
+        # Снимок берется под _db_lock: читатель не увидит запись ни в памяти, ни на диске
+        with self._db_lock:
+            with self._lock:
+                writes, self._writes = self._writes, {}
+                touches, self._touches = self._touches, {}
+                accessed, self._accessed = self._accessed, {}
+                self._last_flush = time.monotonic()
+                self._flush_pending = False
+            if not (writes or touches or accessed):
+                return
+            now = time.time()
+            for key, entry in writes.items():
+                data = json.dumps(entry['payload'], ensure_ascii=False)
+                size = len(data.encode('utf-8'))
+                old = self._conn.execute("SELECT size FROM api_cache WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO api_cache (key, expires_at, etag, payload, size, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, entry['expires_at'], entry['etag'], data, size, now)
+                )
+                self._disk_bytes += size - (old[0] if old else 0)
+            self._conn.executemany(
+                "UPDATE api_cache SET expires_at = ?, accessed_at = ? WHERE key = ?",
+                [(expires_at, now, key) for key, expires_at in touches.items()]
+            )
+            self._conn.executemany(
+                "UPDATE api_cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in accessed.items()]
+            )
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+            self._conn.commit()
+
+    def _evict_disk(self) -> None:
+        """Удаляет давно не читанные записи, пока база не уменьшится до 90% лимита. Вызывается под self._db_lock."""
+        target = self.disk_max_bytes * 0.9
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM api_cache ORDER BY accessed_at"):
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        self._conn.executemany("DELETE FROM api_cache WHERE key = ?", evicted)
+
+    def stats(self) -> dict:
+        total = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "hit_rate": f"{hits / total * 100:.1f}" if total else "0.0",
+            "disk_mb": f"{self._disk_bytes / 1024 / 1024:.1f}"
+        }
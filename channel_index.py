@@ -0,0 +1,63 @@
+# channel_index.py
+
+import os
+import sqlite3
+import threading
+import time
+
+
+class ChannelResolutionIndex:
+    """
+    Постоянный индекс "псевдоним канала -> ID канала" в локальной SQLite-базе.
+    Псевдоним — это @handle, кастомный URL (/c/...), username или поисковый запрос.
+    Позволяет не тратить search.list (100 единиц квоты) на повторные запросы.
+    """
+
+    def __init__(self, db_path: str, ttl: int):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS channel_aliases ("
+            " alias TEXT PRIMARY KEY,"
+            " channel_id TEXT NOT NULL,"
+            " resolved_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _make_alias(alias_type: str, value: str) -> str:
+        return f"{alias_type}:{value.strip().lower()}"
+
+    def get(self, alias_type: str, value: str) -> str | None:
+        alias = self._make_alias(alias_type, value)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT channel_id, resolved_at FROM channel_aliases WHERE alias = ?", (alias,)
+            ).fetchone()
+        if row and time.time() - row[1] < self.ttl:
+            self.hits += 1
+            return row[0]
+        self.misses += 1
+        return None
+
+    def put(self, alias_type: str, value: str, channel_id: str) -> None:
+        alias = self._make_alias(alias_type, value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO channel_aliases (alias, channel_id, resolved_at) VALUES (?, ?, ?)",
+                (alias, channel_id, time.time())
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{self.hits / total * 100:.1f}" if total else "0.0"
+        }
@@ -0,0 +1,109 @@
+# channel_listing.py
+
+import asyncio
+import concurrent.futures
+import itertools
+import threading
+from typing import AsyncIterator
+
+import yt_dlp
+
+from config import YTDLP_WORKERS
+
+# Сколько записей может лежать в очереди, пока загрузчики их не разобрали
+LISTING_QUEUE_SIZE = 100
+
+YDL_OPTS = {
+    'extract_flat': True,
+    'quiet': True,
+    'ignoreerrors': True,
+    'no_warnings': True,
+    'skip_download': True,
+    # User-agent помогает избежать некоторых блокировок
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+}
+
+# yt-dlp синхронный: перечисление каналов идет в своем ограниченном пуле потоков,
+# чтобы долгие листинги не занимали общий executor event loop
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=YTDLP_WORKERS, thread_name_prefix="yt-dlp")
+
+
+class _EndOfListing:
+    def __init__(self, error: Exception | None = None):
+        self.error = error
+
+
+def channel_videos_url(channel_url: str) -> str:
+    """Ссылка на вкладку с видео канала (если не указана вкладка /videos или /shorts)."""
+    clean_url = channel_url.split('?')[0].rstrip('/')
+    if not clean_url.endswith('/videos') and not clean_url.endswith('/shorts'):
+        return clean_url + '/videos'
+    return clean_url
+
+
+def _extract_entries(ydl: yt_dlp.YoutubeDL, url: str):
+    """
+    Ленивый итератор записей: extract_info(process=False) не разворачивает плейлист,
+    следующие страницы листинга запрашиваются по мере чтения записей.
+    """
+    info = ydl.extract_info(url, download=False, process=False)
+    # Канал может ответить ссылкой на настоящий плейлист — переходим по ней один раз
+    if info and info.get('_type') in ('url', 'url_transparent'):
+        info = ydl.extract_info(info['url'], download=False, process=False)
+    if info is None:
+        raise ValueError("YouTube не вернул данные (блокировка IP). Попробуйте позже.")
+    if 'entries' in info:
+        return iter(info['entries'])
+    if 'url' in info or 'id' in info:
+        return iter([info])
+    return iter([])
+
+
+async def iter_channel_entries(channel_url: str, limit: int) -> AsyncIterator[dict]:
+    """
+    Асинхронный генератор: отдает записи видео канала (dict с 'id' и 'title') по мере
+    того, как yt-dlp их находит, не дожидаясь конца листинга. Не больше limit записей.
+    Если генератор закрыт раньше времени, поток с листингом останавливается на следующей записи.
+    Ошибки yt-dlp пробрасываются вызывающему, в том числе посреди листинга: при process=False
+    страницы канала читаются лениво, и ignoreerrors не перехватывает ошибку загрузки очередной страницы.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=LISTING_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Ждем место в очереди, но не дольше, чем потребитель жив
+        future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        while True:
+            try:
+                future.result(timeout=0.5)
+                return True
+            except concurrent.futures.TimeoutError:
+                if stop.is_set():
+                    future.cancel()
+                    return False
+
+    def produce():
+        try:
+            with yt_dlp.YoutubeDL(YDL_OPTS) as ydl:
+                # С ignoreerrors недоступные видео приходят как None и в лимит не считаются;
+                # ошибка загрузки следующей страницы листинга все равно обрывает цикл
+                for entry in itertools.islice(filter(None, _extract_entries(ydl, channel_url)), limit):
+                    if stop.is_set() or not put(entry):
+                        return
+        except Exception as e:
+            put(_EndOfListing(e))
+            return
+        put(_EndOfListing())
+
+    loop.run_in_executor(_executor, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if isinstance(item, _EndOfListing):
+                if item.error:
+                    raise item.error
+                return
+            yield item
+    finally:
+        stop.set()
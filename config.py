@@ -8,7 +8,106 @@ load_dotenv()
 
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
+# Несколько ключей Data API через запятую — запросы распределяются между ними по остатку квоты.
+# Для совместимости поддерживается одиночный YOUTUBE_API_KEY.
+YOUTUBE_API_KEYS = [k.strip() for k in os.getenv("YOUTUBE_API_KEYS", "").split(",") if k.strip()]
+if not YOUTUBE_API_KEYS and os.getenv("YOUTUBE_API_KEY"):
+    YOUTUBE_API_KEYS = [os.getenv("YOUTUBE_API_KEY")]
+YOUTUBE_API_KEY = YOUTUBE_API_KEYS[0] if YOUTUBE_API_KEYS else None
 
 if not TELEGRAM_BOT_TOKEN or not YOUTUBE_API_KEY:
-    raise ValueError("❌ ОШИБКА: TELEGRAM_BOT_TOKEN или YOUTUBE_API_KEY не найдены в окружении! Проверьте файл .env или настройки хостинга.")
\ No newline at end of file
+    raise ValueError("❌ ОШИБКА: TELEGRAM_BOT_TOKEN или YOUTUBE_API_KEY не найдены в окружении! Проверьте файл .env или настройки хостинга.")
+
+# --- YouTube Data API ---
+# Размер отдельного пула потоков для синхронного googleapiclient:
+# столько запросов к Data API может выполняться одновременно.
+YOUTUBE_API_WORKERS = int(os.getenv("YOUTUBE_API_WORKERS", "16"))
+# Таймаут одного HTTP-запроса к Data API (секунды)
+YOUTUBE_API_TIMEOUT = float(os.getenv("YOUTUBE_API_TIMEOUT", "15"))
+# Регионы, для которых подгружается справочник категорий видео (через запятую)
+YOUTUBE_CATEGORY_REGIONS = [r.strip().upper() for r in os.getenv("YOUTUBE_CATEGORY_REGIONS", "US,RU").split(",") if r.strip()]
+# Как часто обновлять справочник категорий (секунды), по умолчанию раз в сутки
+CATEGORY_CACHE_TTL = int(os.getenv("CATEGORY_CACHE_TTL", str(24 * 60 * 60)))
+# Окно (мс), в течение которого одиночные запросы videos.list склеиваются в один пакет
+VIDEO_BATCH_WINDOW_MS = float(os.getenv("VIDEO_BATCH_WINDOW_MS", "5"))
+# Суточная квота Data API на один ключ (единиц) и доля расхода, после которой
+# дорогие операции (выгрузка названий, идеи для Excel) отключаются
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", "10000"))
+QUOTA_EXPENSIVE_THRESHOLD = float(os.getenv("QUOTA_EXPENSIVE_THRESHOLD", "0.8"))
+
+# --- Внешние сервисы ---
+# Сколько (секунды) ответ на анализ видео может ждать каждое из обогащений,
+# прежде чем оно будет заменено на "N/A"
+RYD_DEADLINE = float(os.getenv("RYD_DEADLINE", "2"))
+CATEGORY_DEADLINE = float(os.getenv("CATEGORY_DEADLINE", "3"))
+# Язык названий стран в отчете по видео: ru или en
+COUNTRY_NAMES_LANG = os.getenv("COUNTRY_NAMES_LANG", "ru")
+# Общие HTTP-клиенты: лимиты пула соединений на каждый внешний сервис
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 работает, только если установлен пакет h2 (pip install httpx[http2])
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") == "1"
+
+# --- Локальное хранилище ---
+# Каталог для SQLite-баз и кэшей (на Render смонтируйте сюда persistent disk)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# Сколько хранить соответствие @handle/username -> ID канала (секунды), по умолчанию 30 дней
+CHANNEL_INDEX_TTL = int(os.getenv("CHANNEL_INDEX_TTL", str(30 * 24 * 60 * 60)))
+# Раз в сколько дней перечитывать плейлист загрузок канала целиком
+# (чтобы подхватить удаленные видео и переименования), в остальное время — только новые видео
+VIDEO_STORE_FULL_RESYNC_DAYS = int(os.getenv("VIDEO_STORE_FULL_RESYNC_DAYS", "7"))
+# Сколько секунд список последних видео канала в базе считается свежим
+# (теплокарта и графики сразу после анализа канала не ходят в API)
+VIDEO_STORE_FRESHNESS = int(os.getenv("VIDEO_STORE_FRESHNESS", "300"))
+
+# --- Кэш ответов YouTube Data API (память + диск) ---
+# Сколько ответов держать в памяти и сколько мегабайт — на диске
+API_CACHE_MEMORY_ITEMS = int(os.getenv("API_CACHE_MEMORY_ITEMS", "1000"))
+API_CACHE_DISK_MB = int(os.getenv("API_CACHE_DISK_MB", "200"))
+# Время жизни ответов по методам (секунды); 0 отключает кэширование метода.
+# Статистика видео меняется быстро, каналы и поиск — медленно, категории — почти никогда.
+# playlistItems.list не кэшируется: плейлист загрузок хранится в локальной базе видео (VIDEO_STORE_*).
+API_CACHE_TTL_VIDEOS = int(os.getenv("API_CACHE_TTL_VIDEOS", "600"))
+API_CACHE_TTL_CHANNELS = int(os.getenv("API_CACHE_TTL_CHANNELS", "3600"))
+API_CACHE_TTL_SEARCH = int(os.getenv("API_CACHE_TTL_SEARCH", str(24 * 60 * 60)))
+API_CACHE_TTL_CATEGORIES = int(os.getenv("API_CACHE_TTL_CATEGORIES", str(7 * 24 * 60 * 60)))
+
+# --- Хранилище состояний диалогов (FSM) ---
+# sqlite — файл в DATA_DIR (переживает перезапуск), redis — общий сервер для нескольких
+# процессов бота (нужен пакет redis), memory — в памяти процесса, как раньше
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").lower()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# --- Кэш результатов для inline-кнопок ---
+# Сколько результатов анализа держать в памяти и сколько секунд
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2000"))
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "900"))
+
+# --- Фоновые задачи (выгрузки превью, названий, Excel) ---
+# Сколько тяжелых задач выполняется одновременно на весь бот
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "3"))
+# Сколько задач одного пользователя выполняется одновременно и сколько может ждать в очереди
+JOB_USER_CONCURRENCY = int(os.getenv("JOB_USER_CONCURRENCY", "1"))
+JOB_USER_MAX_QUEUED = int(os.getenv("JOB_USER_MAX_QUEUED", "3"))
+
+# --- Выгрузки ---
+# Сколько байт выгрузки держать в памяти, прежде чем SpooledTemporaryFile уйдет на диск
+SPOOL_MAX_MEMORY = int(os.getenv("SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+# Как часто (секунды) обновлять сообщение с прогрессом длинных операций
+PROGRESS_UPDATE_INTERVAL = float(os.getenv("PROGRESS_UPDATE_INTERVAL", "3"))
+# Сколько листингов каналов через yt-dlp может идти одновременно.
+# Каждая выполняющаяся выгрузка превью держит один поток листинга до конца задачи:
+# при YTDLP_WORKERS < JOB_WORKERS лишние выгрузки стоят, пока не освободится поток
+YTDLP_WORKERS = int(os.getenv("YTDLP_WORKERS", str(JOB_WORKERS)))
+# Сколько превью скачивать одновременно
+THUMB_DOWNLOAD_CONCURRENCY = int(os.getenv("THUMB_DOWNLOAD_CONCURRENCY", "8"))
+# Лимиты одного архива с превью в /download_prev (Telegram принимает файлы до 50 МБ)
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES", str(45 * 1024 * 1024)))
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", "500"))
+# Сколько мегабайт превью хранить в локальном кэше (DATA_DIR/thumbnails)
+THUMB_CACHE_MB = int(os.getenv("THUMB_CACHE_MB", "500"))
+# Сколько секунд превью в кэше считается актуальным (автор может заменить картинку)
+THUMB_CACHE_TTL = int(os.getenv("THUMB_CACHE_TTL", str(7 * 24 * 3600)))
+# Сколько секунд помнить, что качества у видео нет (maxresdefault появляется после обработки)
+THUMB_MISSING_TTL = int(os.getenv("THUMB_MISSING_TTL", str(6 * 3600)))
@@ -0,0 +1,105 @@
+# fsm_storage.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import DATA_DIR, FSM_STORAGE, REDIS_URL
+
+try:
+    from aiogram.fsm.storage.redis import RedisStorage  # нужен пакет redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Хранилище состояний FSM (шаг диалога и его данные) в локальной SQLite-базе.
+    Состояния переживают перезапуск, а база в WAL-режиме может использоваться
+    несколькими процессами бота на одной машине.
+    Запросы к SQLite выполняются в потоке, чтобы не блокировать event loop.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            " key TEXT PRIMARY KEY,"
+            " state TEXT,"
+            " data TEXT NOT NULL DEFAULT '{}')"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _make_key(key: StorageKey) -> str:
+        parts = [key.bot_id, key.chat_id, key.user_id, key.thread_id,
+                 getattr(key, 'business_connection_id', None), key.destiny]
+        return ":".join("" if part is None else str(part) for part in parts)
+
+    def _execute(self, query: str, params: tuple) -> None:
+        with self._lock:
+            self._conn.execute(query, params)
+            self._conn.commit()
+
+    def _fetch_one(self, query: str, params: tuple) -> tuple | None:
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()
+
+    def _close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO fsm (key, state) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET state = excluded.state",
+            (self._make_key(key), value)
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await asyncio.to_thread(self._fetch_one, "SELECT state FROM fsm WHERE key = ?", (self._make_key(key),))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO fsm (key, data) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data",
+            (self._make_key(key), json.dumps(data, ensure_ascii=False))
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await asyncio.to_thread(self._fetch_one, "SELECT data FROM fsm WHERE key = ?", (self._make_key(key),))
+        return json.loads(row[0]) if row else {}
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._close)
+
+
+def create_fsm_storage() -> BaseStorage:
+    """
+    Хранилище FSM по настройке FSM_STORAGE:
+    'sqlite' — файл в DATA_DIR (по умолчанию), 'redis' — сервер по REDIS_URL
+    (общий для нескольких процессов и машин), 'memory' — в памяти процесса.
+    """
+    if FSM_STORAGE == "redis":
+        # Тихий откат на локальную базу разнес бы состояния разных процессов — лучше не запускаться
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("FSM_STORAGE=redis, но пакет redis не установлен (pip install 'aiogram[redis]')")
+        return RedisStorage.from_url(REDIS_URL)
+    if FSM_STORAGE == "memory":
+        return MemoryStorage()
+    return SQLiteStorage(os.path.join(DATA_DIR, "fsm.sqlite3"))
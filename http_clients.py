@@ -0,0 +1,65 @@
+# http_clients.py
+
+import logging
+
+import httpx
+
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED
+
+try:
+    import h2  # noqa: F401  (нужен httpx для HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Внешние сервисы: у каждого свой клиент и свой пул соединений
+SERVICES = {
+    'ryd': {"base_url": "https://returnyoutubedislikeapi.com", "timeout": 5.0},
+    'thumbnails': {"base_url": "", "timeout": 15.0},  # i.ytimg.com / img.youtube.com
+}
+
+
+class HttpClientPool:
+    """
+    Общие httpx-клиенты для всего бота: соединения (и TLS-сессии) переиспользуются
+    между запросами вместо создания нового клиента на каждый вызов.
+    Клиенты создаются при старте (или лениво при первом обращении) и закрываются в shutdown().
+    """
+
+    def __init__(self):
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        service = SERVICES[name]
+        return httpx.AsyncClient(
+            base_url=service["base_url"],
+            timeout=service["timeout"],
+            http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            follow_redirects=True
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._create(name)
+            self._clients[name] = client
+        return client
+
+    async def startup(self) -> None:
+        for name in SERVICES:
+            self.get(name)
+        if HTTP2_ENABLED and not HTTP2_AVAILABLE:
+            logging.warning("HTTP/2 включен, но пакет h2 не установлен (pip install httpx[http2]) — используется HTTP/1.1")
+
+    async def shutdown(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+
+http_clients = HttpClientPool()
@@ -0,0 +1,22 @@
+# input_files.py
+
+from typing import IO, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE, InputFile
+
+
+class SpooledInputFile(InputFile):
+    """
+    Файл для отправки в Telegram из открытого файлового объекта
+    (например, tempfile.SpooledTemporaryFile) без копирования всего содержимого в bytes.
+    """
+
+    def __init__(self, file: IO[bytes], filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
@@ -0,0 +1,69 @@
+# job_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class JobStore:
+    """
+    Постоянное хранилище фоновых задач в локальной SQLite-базе.
+    Задача лежит здесь с момента постановки в очередь до завершения или отмены,
+    вместе с параметрами и последней контрольной точкой (checkpoint) — после
+    перезапуска контейнера незавершенные задачи продолжаются с нее.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " user_id INTEGER NOT NULL,"
+            " chat_id INTEGER NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " params TEXT NOT NULL,"
+            " checkpoint TEXT NOT NULL DEFAULT '{}',"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def add(self, user_id: int, chat_id: int, kind: str, title: str, params: dict) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (user_id, chat_id, kind, title, params, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, chat_id, kind, title, json.dumps(params, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+        return cursor.lastrowid
+
+    def save_checkpoint(self, job_id: int, checkpoint: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET checkpoint = ? WHERE job_id = ?",
+                (json.dumps(checkpoint, ensure_ascii=False), job_id)
+            )
+            self._conn.commit()
+
+    def delete(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def load_all(self) -> list[dict]:
+        """Незавершенные задачи в порядке постановки в очередь."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY job_id").fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['params'] = json.loads(job['params'])
+            job['checkpoint'] = json.loads(job['checkpoint'])
+            jobs.append(job)
+        return jobs
@@ -0,0 +1,261 @@
+# jobs.py
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+
+from config import PROGRESS_UPDATE_INTERVAL
+from job_store import JobStore
+
+
+class JobError(Exception):
+    """Ожидаемая ошибка задачи: текст показывается пользователю как есть."""
+
+
+class Job:
+    """
+    Тяжелая операция пользователя, выполняемая в фоне.
+    Задача не держит Message: ответ отправляется через bot по chat_id.
+    В checkpoint задача складывает свой прогресс (JSON-совместимый) и сохраняет его
+    через save_checkpoint(): после перезапуска бота она получит его обратно.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, bot: Bot, user_id: int, chat_id: int, kind: str, title: str,
+                 func: Callable[['Job'], Awaitable[None]], params: dict,
+                 job_id: int | None = None, checkpoint: dict | None = None, store: JobStore | None = None):
+        self.id = job_id if job_id is not None else next(self._ids)
+        self.bot = bot
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.kind = kind
+        self.title = title
+        self.func = func
+        self.params = params
+        self.checkpoint = checkpoint or {}
+        self.store = store
+        self.status_message_id: int | None = None
+        self.task: asyncio.Task | None = None
+        self.cancelled = False
+        self._last_progress = 0.0
+
+    async def progress(self, text: str, force: bool = False) -> None:
+        """Обновляет сообщение со статусом задачи, не чаще раза в PROGRESS_UPDATE_INTERVAL."""
+        if not force and time.monotonic() - self._last_progress < PROGRESS_UPDATE_INTERVAL:
+            return
+        self._last_progress = time.monotonic()
+        if self.status_message_id is None:
+            return
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.status_message_id)
+        except Exception:
+            pass  # Текст не изменился или сообщение удалено
+
+    def save_checkpoint(self) -> None:
+        if self.store:
+            self.store.save_checkpoint(self.id, self.checkpoint)
+
+    async def answer(self, text: str, **kwargs):
+        return await self.bot.send_message(self.chat_id, text, **kwargs)
+
+    async def answer_document(self, document, **kwargs):
+        return await self.bot.send_document(self.chat_id, document, **kwargs)
+
+
+class JobQueue:
+    """
+    Очередь тяжелых задач с ограниченным пулом исполнителей.
+
+    Одновременно выполняется не больше workers задач, у одного пользователя —
+    не больше per_user_running; в очереди у пользователя не больше per_user_queued задач.
+    Пользователи обслуживаются по кругу: задача пользователя, только что получившего
+    исполнителя, ставится за задачами остальных, поэтому один пользователь с кучей
+    выгрузок не задерживает других.
+
+    Если передан store, задачи переживают перезапуск: при остановке бота они остаются
+    в хранилище, и resume() ставит их в очередь заново вместе с контрольными точками.
+    """
+
+    def __init__(self, bot: Bot, workers: int, per_user_running: int, per_user_queued: int,
+                 store: JobStore | None = None):
+        self.bot = bot
+        self.store = store
+        self.workers = workers
+        self.per_user_running = per_user_running
+        self.per_user_queued = per_user_queued
+        # user_id -> очередь его задач; порядок ключей — порядок обслуживания пользователей
+        self._pending: OrderedDict[int, deque[Job]] = OrderedDict()
+        self._running: dict[int, list[Job]] = {}
+        self._cond = asyncio.Condition()
+        self._worker_tasks: list[asyncio.Task] = []
+        self._stopping = False
+        self.completed = 0
+        self.failed = 0
+        self.resumed = 0
+
+    def start(self) -> None:
+        for _ in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self) -> None:
+        """Останавливает исполнителей; незавершенные задачи остаются в хранилище до resume()."""
+        self._stopping = True
+        for jobs in list(self._running.values()):
+            for job in jobs:
+                job.cancelled = True
+                if job.task:
+                    job.task.cancel()
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+
+    def _queued_count(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+
+    async def submit(self, user_id: int, chat_id: int, kind: str, title: str,
+                     func: Callable[[Job], Awaitable[None]], params: dict, reply_markup=None) -> Job | str:
+        """
+        Ставит задачу в очередь и сразу возвращается.
+        func(job) выполняется исполнителем; params доступны ему как job.params.
+        reply_markup прикладывается к сообщению о постановке в очередь.
+        Возвращает Job или текст ошибки, если у пользователя слишком много задач в очереди.
+        """
+        queue = self._pending.get(user_id)
+        if queue and len(queue) >= self.per_user_queued:
+            return f"У вас уже {len(queue)} задач в очереди. Дождитесь их выполнения или отмените через /cancel."
+        job_id = self.store.add(user_id, chat_id, kind, title, params) if self.store else None
+        job = Job(self.bot, user_id, chat_id, kind, title, func, params, job_id=job_id, store=self.store)
+        await self._enqueue(job, f"🕒 {title}: задача в очереди (позиция {self._queued_count() + 1})...",
+                            reply_markup=reply_markup)
+        return job
+
+    async def resume(self, handlers: dict[str, Callable[[Job], Awaitable[None]]]) -> int:
+        """
+        Ставит в очередь задачи, не завершенные до перезапуска.
+        handlers — функции задач по их kind. Возвращает число возобновленных задач.
+        """
+        if not self.store:
+            return 0
+        resumed = 0
+        for record in self.store.load_all():
+            func = handlers.get(record['kind'])
+            if func is None:
+                self.store.delete(record['job_id'])
+                continue
+            job = Job(self.bot, record['user_id'], record['chat_id'], record['kind'], record['title'], func,
+                      record['params'], job_id=record['job_id'], checkpoint=record['checkpoint'], store=self.store)
+            try:
+                await self._enqueue(job, f"🔄 {job.title}: бот перезапущен, задача продолжится с места остановки...")
+            except Exception as e:
+                # Чат недоступен (например, бот заблокирован) — продолжать некому
+                logging.warning(f"Не удалось возобновить задачу {job.kind} #{job.id}: {e}")
+                self.store.delete(job.id)
+                continue
+            resumed += 1
+        self.resumed += resumed
+        return resumed
+
+    async def _enqueue(self, job: Job, text: str, reply_markup=None) -> None:
+        status = await self.bot.send_message(job.chat_id, text, reply_markup=reply_markup)
+        job.status_message_id = status.message_id
+        async with self._cond:
+            self._pending.setdefault(job.user_id, deque()).append(job)
+            self._cond.notify()
+
+    def _finish(self, job: Job) -> None:
+        if self.store:
+            self.store.delete(job.id)
+
+    async def cancel_user(self, user_id: int) -> int:
+        """Отменяет все задачи пользователя (в очереди и выполняющиеся). Возвращает их количество."""
+        async with self._cond:
+            queued = list(self._pending.pop(user_id, ()))
+            running = list(self._running.get(user_id, ()))
+        for job in queued:
+            job.cancelled = True
+            self._finish(job)
+            await job.progress(f"🚫 {job.title}: задача отменена.", force=True)
+        for job in running:
+            job.cancelled = True
+            if job.task:
+                job.task.cancel()
+        return len(queued) + len(running)
+
+    def _next_job(self) -> Job | None:
+        for user_id in list(self._pending):
+            if len(self._running.get(user_id, ())) >= self.per_user_running:
+                continue
+            queue = self._pending.pop(user_id)
+            job = queue.popleft()
+            if queue:
+                # Пользователь уходит в конец круга
+                self._pending[user_id] = queue
+            return job
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._cond:
+                job = self._next_job()
+                while job is None:
+                    await self._cond.wait()
+                    job = self._next_job()
+                self._running.setdefault(job.user_id, []).append(job)
+            try:
+                await self._run(job)
+            finally:
+                async with self._cond:
+                    running = self._running.get(job.user_id, [])
+                    running.remove(job)
+                    if not running:
+                        self._running.pop(job.user_id, None)
+                    # Освободилось место у пользователя — его следующая задача может стартовать
+                    self._cond.notify_all()
+
+    async def _run(self, job: Job) -> None:
+        await job.progress(f"⏳ {job.title}...", force=True)
+        if job.cancelled:
+            self._finish(job)
+            await job.progress(f"🚫 {job.title}: задача отменена.", force=True)
+            return
+        job.task = asyncio.create_task(job.func(job))
+        # wait, а не await: отмена задачи через /cancel не должна отменять исполнителя
+        await asyncio.wait([job.task])
+        if job.task.cancelled():
+            if self._stopping:
+                # Бот останавливается: задача остается в хранилище и продолжится после запуска
+                return
+            self._finish(job)
+            await job.progress(f"🚫 {job.title}: задача отменена.", force=True)
+            return
+        self._finish(job)
+        error = job.task.exception()
+        if error is None:
+            self.completed += 1
+            try:
+                await self.bot.delete_message(job.chat_id, job.status_message_id)
+            except Exception:
+                pass
+            return
+        self.failed += 1
+        if isinstance(error, JobError):
+            await job.progress(f"❌ {error}", force=True)
+        else:
+            logging.error(f"Задача {job.kind} #{job.id} упала", exc_info=error)
+            await job.progress(f"❌ {job.title}: ошибка — {error}", force=True)
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queued_count(),
+            "running": sum(len(jobs) for jobs in self._running.values()),
+            "completed": self.completed,
+            "failed": self.failed,
+            "resumed": self.resumed
+        }
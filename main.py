@@ -5,11 +5,7 @@ import html
 import io
 import os
 import asyncio
-import zipfile
-import shutil
-import aiohttp
-import yt_dlp
-import httpx
+import tempfile
 import numpy as np
 from datetime import datetime
 
@@ -18,9 +14,22 @@ from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, StateFilter, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import BufferedInputFile, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, FSInputFile
-
-from config import TELEGRAM_BOT_TOKEN
+from aiogram.types import BufferedInputFile, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+
+from config import (
+    TELEGRAM_BOT_TOKEN, SPOOL_MAX_MEMORY, DATA_DIR,
+    RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+    JOB_WORKERS, JOB_USER_CONCURRENCY, JOB_USER_MAX_QUEUED
+)
+from cache import TTLCache
+from fsm_storage import create_fsm_storage
+from input_files import SpooledInputFile
+from job_store import JobStore
+from jobs import Job, JobError, JobQueue
+from http_clients import http_clients
+from channel_listing import iter_channel_entries, channel_videos_url
+from thumbnail_cache import thumbnail_cache
+from thumbnail_pipeline import ThumbnailPipeline
 from youtube_analyzer import YouTubeAnalyzer
 from trends_analyzer import analyze_google_trends
 from excel_generator import ExcelGenerator
@@ -29,8 +38,17 @@ from channel_graphics import create_activity_graphs, create_heatmap_graph
 logging.basicConfig(level=logging.INFO)
 
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
-dp = Dispatcher()
+# Состояния диалогов хранятся вне процесса (см. fsm_storage), а не в памяти
+dp = Dispatcher(storage=create_fsm_storage())
 youtube_analyzer = YouTubeAnalyzer()
+# Результаты недавних анализов: кнопки под ответом отвечают из памяти
+result_cache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+# Тяжелые выгрузки выполняются в фоне ограниченным пулом исполнителей
+# и переживают перезапуск бота (см. job_store)
+jobs = JobQueue(
+    bot, workers=JOB_WORKERS, per_user_running=JOB_USER_CONCURRENCY, per_user_queued=JOB_USER_MAX_QUEUED,
+    store=JobStore(os.path.join(DATA_DIR, "jobs.sqlite3"))
+)
 
 # --- СОСТОЯНИЯ ---
 class UserStates(StatesGroup):
@@ -72,18 +90,13 @@ def format_number(num_str: str) -> str:
     except (ValueError, TypeError):
         return str(num_str)
 
-async def get_country_info(code: str) -> str:
-    if code == 'N/A': return ""
-    try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            response = await client.get(f"https://restcountries.com/v3.1/alpha/{code}")
-            response.raise_for_status()
-            data = response.json()[0]
-            country_name = data['name']['common']
-            flag_emoji = "".join([chr(0x1F1E6 + ord(char) - ord('A')) for char in code.upper()])
-            return f"{flag_emoji} {country_name} ({code})"
-    except Exception:
-        return f"({code})"
+async def get_video_data_cached(video_id: str) -> dict:
+    data = result_cache.get(f"video:{video_id}")
+    if data is None:
+        data = await youtube_analyzer.get_video_data_by_id(video_id)
+        if not data.get("error"):
+            result_cache.set(f"video:{video_id}", data)
+    return data
 
 def generate_metadata_content(data: dict) -> str:
     # Функция для генерации txt файла
@@ -108,159 +121,127 @@ def generate_metadata_content(data: dict) -> str:
 
 # --- 🚀 ФУНКЦИИ СКАЧИВАНИЯ (ЯДРО) ---
 
-async def send_archive(message, file_paths, part_num, total_processed):
-    """Создает архив и отправляет его в чат."""
-    if not file_paths: return
-
-    zip_filename = f"thumbnails_part_{part_num}.zip"
+async def enqueue_job(message: types.Message, kind: str, title: str, func, reply_markup=None, **params) -> Job | None:
+    """
+    Ставит тяжелую операцию в очередь фоновых задач; хендлер возвращается сразу.
+    Возвращает Job или None, если очередь пользователя заполнена (ему уже отправлен ответ):
+    тогда хендлер не сбрасывает состояние диалога, и введенные данные не теряются.
+    """
+    job = await jobs.submit(message.from_user.id, message.chat.id, kind, title, func, params, reply_markup=reply_markup)
+    if isinstance(job, str):
+        await message.answer(f"❌ {job}")
+        return None
+    return job
+
+async def send_archive(job: Job, buffer, part_num: int, files_count: int, total_processed: int) -> bool:
+    """Отправляет готовый архив из памяти в чат. Возвращает True, если архив доставлен."""
+    caption = f"📁 Архив №{part_num}\n🖼 Картинок: {files_count}\n(Всего обработано: {total_processed})"
     try:
-        with zipfile.ZipFile(zip_filename, 'w', compression=zipfile.ZIP_STORED) as zipf:
-            for file_p in file_paths:
-                zipf.write(file_p, arcname=os.path.basename(file_p))
-        
-        input_file = FSInputFile(zip_filename)
-        caption = f"📁 Архив №{part_num}\n🖼 Картинок: {len(file_paths)}\n(Всего обработано: {total_processed})"
-        await message.answer_document(input_file, caption=caption)
+        await job.answer_document(SpooledInputFile(buffer, filename=f"thumbnails_part_{part_num}.zip"), caption=caption)
+        return True
     except Exception as e:
-        await message.answer(f"⚠️ Ошибка отправки архива №{part_num}: {e}")
-    finally:
-        if os.path.exists(zip_filename):
-            try: os.remove(zip_filename)
-            except: pass
-        await asyncio.sleep(1)
+        await job.answer(f"⚠️ Ошибка отправки архива №{part_num}: {e}")
+        return False
 
-async def batch_download_and_send(message: types.Message, channel_url: str, limit: int):
+async def download_thumbnails_job(job: Job):
     """
-    Основная логика скачивания HD превью с защитой от ошибок на Render.
+    Фоновая задача /download_prev: скачивание HD превью с защитой от ошибок на Render.
+    Список видео читается через yt-dlp постранично, и превью начинают качаться
+    с первых найденных видео; скачивание, упаковка в архивы в памяти и отправка
+    идут конвейером (см. channel_listing и thumbnail_pipeline).
+    После каждого отправленного архива в контрольную точку записываются его номер и ID
+    видео в нем: после перезапуска эти видео не скачиваются и не отправляются повторно.
     """
-    clean_url = channel_url.split('?')[0].rstrip('/')
-    if not clean_url.endswith('/videos') and not clean_url.endswith('/shorts'):
-        target_url = clean_url + '/videos'
-    else:
-        target_url = clean_url
+    channel_url, limit = job.params['channel_url'], job.params['limit']
+    done_ids = set(job.checkpoint.get('done_ids', []))
+    await job.progress(f"🔄 Сканирую список видео (лимит: {limit})... Поиск HD картинок...", force=True)
+
+    async def report_progress(processed: int):
+        await job.progress(f"📦 Обработано {processed} из {limit} (HD качество)...")
+
+    async def upload(buffer, part_num, files_count, total_processed, video_ids):
+        if await send_archive(job, buffer, part_num, files_count, total_processed):
+            done_ids.update(video_ids)
+        job.checkpoint.update(parts_sent=part_num, done_ids=sorted(done_ids))
+        job.save_checkpoint()
+
+    pipeline = ThumbnailPipeline(
+        on_archive=upload, on_progress=report_progress,
+        skip_ids=done_ids, first_part=job.checkpoint.get('parts_sent', 0) + 1
+    )
+    try:
+        await pipeline.run(iter_channel_entries(channel_videos_url(channel_url), limit))
+    except Exception as e:
+        if pipeline.processed == 0 and not done_ids:
+            raise JobError(f"Ошибка при поиске: {e}")
+        # Листинг оборвался на середине: run() уже упаковал и отправил все, что успел скачать
+        await job.answer(f"⚠️ Список видео получен не полностью: {e}")
+
+    if pipeline.processed == 0 and not done_ids:
+        raise JobError("Видео не найдены. Возможно, канал пуст или требуется капча.")
 
-    status_msg = await message.answer(f"🔄 Сканирую список видео (лимит: {limit})... Поиск HD картинок...")
+    # Считаются только превью из доставленных архивов (включая отправленные до перезапуска)
+    await job.answer(f"✅ Готово! Отправлено в высоком качестве: {len(done_ids)} шт.", parse_mode="HTML")
 
-    ydl_opts = {
-        'extract_flat': True,
-        'quiet': True,
-        'playlistend': limit,
-        'ignoreerrors': True,
-        'no_warnings': True,
-        'skip_download': True,
-        # User-agent помогает избежать некоторых блокировок
-        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-    }
+async def export_titles_job(job: Job):
+    """
+    Фоновая задача /get_titles: все названия видео канала в txt-файле.
+    Прочитанные страницы плейлиста сохраняются в локальной базе видео вместе с токеном
+    следующей страницы, поэтому после перезапуска задача дочитывает канал, а не начинает заново.
+    """
+    res = await youtube_analyzer.resolve_channel(job.params['channel_input'])
+    if res.get("error"):
+        raise JobError(res['error'])
 
+    # Названия пишутся в файл по мере прихода страниц, память не растет с размером канала.
+    # Заголовок с количеством резервируется фиксированной ширины и дописывается в конце.
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
     try:
-        loop = asyncio.get_event_loop()
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = await loop.run_in_executor(None, lambda: ydl.extract_info(target_url, download=False))
-            
-        # --- ЗАЩИТА ОТ БЛОКИРОВКИ RENDER ---
-        if info is None:
-            await status_msg.edit_text("❌ Ошибка: YouTube не вернул данные (блокировка IP). Попробуйте позже.")
-            return
-        # -----------------------------------
-
-        if 'entries' in info: entries = list(info['entries'])
-        elif 'url' in info: entries = [info]
-        else: entries = []
-
-        total_found = len(entries)
-        if total_found == 0:
-            await status_msg.edit_text("❌ Видео не найдены. Возможно, канал пуст или требуется капча.")
-            return
-
-        await status_msg.edit_text(f"✅ Найдено видео: {total_found}. Начинаю скачивание HD превью...")
+        spool.write(f"Всего: {0:<10}\n\n".encode('utf-8'))
+        count = 0
+
+        async def on_sync_progress(fetched: int):
+            await job.progress(f"⏳ Загружаю список видео с YouTube... {fetched}")
+
+        try:
+            async for titles in youtube_analyzer.iter_video_title_pages(res['channel_id'], on_progress=on_sync_progress):
+                for title in titles:
+                    if count:
+                        spool.write(b"\n")
+                    spool.write(title.encode('utf-8'))
+                    count += 1
+                await job.progress(f"⏳ Собираю заголовки... {count}")
+        except Exception as e:
+            raise JobError(f"Ошибка при сборе видео: {e}")
+
+        if not count:
+            raise JobError("Видео не найдены.")
+
+        spool.seek(0)
+        spool.write(f"Всего: {count:<10}".encode('utf-8'))
+        await job.answer_document(SpooledInputFile(spool, filename="titles.txt"), caption=f"✅ Готово: {count}")
+    finally:
+        spool.close()
 
-    except Exception as e:
-        await status_msg.edit_text(f"❌ Ошибка при поиске: {str(e)}")
-        return
+async def build_excel_job(job: Job):
+    """Фоновая задача: Excel-файл анализа ниши из собранных каналов."""
+    niche_name, channels = job.params['niche_name'], job.params['channels']
 
-    # Настройки пачек
-    MAX_ARCHIVE_SIZE = 45 * 1024 * 1024  # 45 МБ
-    MAX_FILES_COUNT = 500                
-    
-    temp_dir = f"temp_thumbs_{message.from_user.id}"
-    if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
-    os.makedirs(temp_dir)
-
-    current_batch_files = []
-    current_batch_size = 0
-    part_num = 1
-    processed_count = 0
-
-    async with aiohttp.ClientSession() as session:
-        for index, entry in enumerate(entries):
-            video_id = entry.get('id')
-            title = entry.get('title', 'video')
-            if not video_id: continue
-
-            targets = [
-                f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
-                f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-            ]
-            
-            img_data = None
-            found_quality = False
-
-            try:
-                for url in targets:
-                    async with session.get(url) as resp:
-                        if resp.status == 200:
-                            img_data = await resp.read()
-                            found_quality = True
-                            break 
-                
-                if not found_quality or not img_data: continue
-                    
-                file_size = len(img_data)
-                
-                # Проверка лимитов и отправка пачки
-                is_size_limit = (current_batch_size + file_size) > MAX_ARCHIVE_SIZE
-                is_count_limit = len(current_batch_files) >= MAX_FILES_COUNT
-                
-                if (is_size_limit or is_count_limit) and current_batch_files:
-                    await send_archive(message, current_batch_files, part_num, processed_count)
-                    
-                    for f in current_batch_files:
-                        try: os.remove(f)
-                        except: pass
-                    
-                    part_num += 1
-                    current_batch_files = []
-                    current_batch_size = 0
-                    
-                    if index % 50 == 0:
-                        try: await status_msg.edit_text(f"📦 Обработано {index} из {total_found} (HD качество)...")
-                        except: pass
-
-                safe_title = "".join([c for c in title if c.isalpha() or c.isdigit() or c==' ']).strip()
-                safe_title = safe_title[:50] 
-                if not safe_title: safe_title = "img"
-                
-                filename = f"{safe_title}_{video_id}.jpg"
-                filepath = os.path.join(temp_dir, filename)
-                
-                with open(filepath, 'wb') as f: f.write(img_data)
-                
-                current_batch_files.append(filepath)
-                current_batch_size += file_size
-                processed_count += 1
-                        
-            except Exception: continue
-
-        # Отправка остатков
-        if current_batch_files:
-            await send_archive(message, current_batch_files, part_num, processed_count)
-
-    if os.path.exists(temp_dir): shutil.rmtree(temp_dir)
-    
-    try: await status_msg.delete()
-    except: pass
-    
-    await message.answer(f"✅ Готово! Скачано в высоком качестве: {processed_count} шт.", parse_mode="HTML")
+    def build() -> bytes:
+        gen = ExcelGenerator(niche_name)
+        for ch in channels: gen.add_channel_data(ch['category'], ch)
+        return gen.save_to_buffer().getvalue()
+
+    # Сборка xlsx занимает процессор — выполняем ее вне event loop
+    content = await asyncio.to_thread(build)
+    await job.answer_document(BufferedInputFile(content, filename=f"{niche_name}.xlsx"), caption="Ваш анализ готов.")
+
+# Функции фоновых задач по типу: по ним задачи восстанавливаются после перезапуска
+JOB_HANDLERS = {
+    'download_prev': download_thumbnails_job,
+    'titles_export': export_titles_job,
+    'excel': build_excel_job,
+}
 
 # --- ОБРАБОТЧИКИ КОМАНД ---
 
@@ -286,7 +267,33 @@ async def command_start_handler(message: types.Message, state: FSMContext):
 @dp.message(Command("cancel"))
 async def command_cancel_handler(message: types.Message, state: FSMContext):
     await state.clear()
-    await message.answer("Действие отменено.", reply_markup=get_main_keyboard())
+    cancelled = await jobs.cancel_user(message.from_user.id)
+    text = "Действие отменено." + (f" Остановлено задач: {cancelled}." if cancelled else "")
+    await message.answer(text, reply_markup=get_main_keyboard())
+
+@dp.message(Command("stats"))
+async def command_stats_handler(message: types.Message):
+    index_stats = youtube_analyzer.channel_index.stats()
+    flight_stats = youtube_analyzer.singleflight_stats()
+    quota_stats = youtube_analyzer.quota_stats()
+    cache_stats = result_cache.stats()
+    api_cache_stats = youtube_analyzer.api_cache_stats()
+    thumb_stats = thumbnail_cache.stats()
+    job_stats = jobs.stats()
+    lines = [
+        "📊 <b>Статистика бота</b>",
+        f"├ Квота API ({quota_stats['keys']} ключ.): израсходовано {quota_stats['used']} из {quota_stats['limit']}, осталось {quota_stats['remaining']}",
+        f"├ Кэш результатов: {cache_stats['size']} записей, попаданий {cache_stats['hit_rate']} %",
+        f"├ Кэш ответов API: память {api_cache_stats['memory_hits']}, диск {api_cache_stats['disk_hits']}, "
+        f"промахов {api_cache_stats['misses']} ({api_cache_stats['hit_rate']} %), "
+        f"не изменилось (304) {api_cache_stats['revalidated']}, на диске {api_cache_stats['disk_mb']} МБ",
+        f"├ Фоновые задачи: выполняется {job_stats['running']}, в очереди {job_stats['queued']}, "
+        f"готово {job_stats['completed']}, с ошибкой {job_stats['failed']}, возобновлено {job_stats['resumed']}",
+        f"├ Кэш превью: попаданий {thumb_stats['hits']}, промахов {thumb_stats['misses']} ({thumb_stats['hit_rate']} %), {thumb_stats['size_mb']} МБ",
+        f"├ Индекс каналов: попаданий {index_stats['hits']}, промахов {index_stats['misses']} ({index_stats['hit_rate']} %)",
+        f"└ Схлопнуто одинаковых запросов: {flight_stats['collapsed']} из {flight_stats['calls'] + flight_stats['collapsed']}"
+    ]
+    await message.answer("\n".join(lines), parse_mode="HTML")
 
 # --- АНАЛИЗ ВИДЕО И КАНАЛОВ ---
 
@@ -300,21 +307,12 @@ async def run_video_analysis(message: types.Message, video_url: str, state: FSMC
         return
     
     video_id = data['video_id']
-    
-    # --- 1. ДИЗЛАЙКИ ---
-    dislikes_count = 0
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://returnyoutubedislikeapi.com/votes?videoId={video_id}") as resp:
-                if resp.status == 200:
-                    ryd_data = await resp.json()
-                    dislikes_count = ryd_data.get('dislikes', 0)
-    except Exception:
-        dislikes_count = 0 
-    # -------------------
+    result_cache.set(f"video:{video_id}", data)
+    # Дизлайки, категория и ГЕО уже собраны анализатором параллельно
+    dislikes_count = data.get('dislikes', 'N/A')
 
     formatted_date = datetime.fromisoformat(data['published_at'].replace('Z', '+00:00')).strftime("%d.%m.%Y %H:%M:%S")
-    geo_info = await get_country_info(data.get('geo_code', 'N/A'))
+    geo_info = data.get('geo_info', '')
     
     safe_title = html.escape(data['title'])
     safe_desc = html.escape(data.get('description', 'Нет описания'))
@@ -364,6 +362,9 @@ async def run_channel_analysis(message: types.Message, channel_input: str, state
         await state.clear()
         return
 
+    if 'recent_stats' in data:
+        result_cache.set(f"health:{data['channel_id']}", data['recent_stats'])
+
     formatted_date = datetime.fromisoformat(data['published_at'].replace('Z', '+00:00')).strftime("%d.%m.%Y")
     lines = [f"👤 <b>Канал: <a href='{data['url']}'>{html.escape(data['title'])}</a></b>",
              f"├ Создан: <code>{formatted_date}</code>",
@@ -421,7 +422,7 @@ async def command_download_prev(message: types.Message, state: FSMContext):
 async def process_thumb_channel_step(message: types.Message, state: FSMContext):
     channel_input = message.text.strip()
     msg = await message.answer("🔍 Проверяю канал...")
-    channel_data = await youtube_analyzer.analyze_channel(channel_input)
+    channel_data = await youtube_analyzer.analyze_channel(channel_input, fields={'title', 'video_count'})
     
     if channel_data.get("error"):
         await msg.edit_text(f"❌ Ошибка: {channel_data['error']}")
@@ -454,11 +455,9 @@ async def process_thumb_count_step(message: types.Message, state: FSMContext):
         await message.answer(f"⚠️ Всего {max_videos} видео. Скачиваю все.")
         count = max_videos
 
-    await message.answer(f"🚀 Запуск скачивания {count} превью...")
-    await state.clear()
-    
-    # Запускаем функцию скачивания
-    await batch_download_and_send(message, channel_input, count)
+    if await enqueue_job(message, 'download_prev', f"Скачивание {count} превью", download_thumbnails_job,
+                         channel_url=channel_input, limit=count):
+        await state.clear()
 
 
 # --- CALLBACKS ---
@@ -497,7 +496,7 @@ async def cb_excel(cb: types.CallbackQuery, state: FSMContext):
 async def cb_dl_meta(cb: types.CallbackQuery):
     video_id = cb.data.split(":")[-1]
     await cb.answer("⏳ Готовлю файл...")
-    data = await youtube_analyzer.get_video_data_by_id(video_id)
+    data = await get_video_data_cached(video_id)
     if not data.get("error"):
         content = generate_metadata_content(data)
         file = BufferedInputFile(content.encode('utf-8'), filename=f"{video_id}_meta.txt")
@@ -507,7 +506,7 @@ async def cb_dl_meta(cb: types.CallbackQuery):
 async def cb_dl_thumb(cb: types.CallbackQuery):
     video_id = cb.data.split(":")[-1]
     await cb.answer("⏳ Загружаю...")
-    data = await youtube_analyzer.get_video_data_by_id(video_id)
+    data = await get_video_data_cached(video_id)
     if data.get("thumbnail_url"):
         await cb.message.answer_photo(data['thumbnail_url'])
 
@@ -515,7 +514,11 @@ async def cb_dl_thumb(cb: types.CallbackQuery):
 async def cb_show_graphs(cb: types.CallbackQuery):
     channel_id = cb.data.split(":")[-1]
     await cb.answer("🎨 Рисую...")
-    stats = await youtube_analyzer.get_recent_video_stats(channel_id)
+    stats = result_cache.get(f"health:{channel_id}")
+    if stats is None:
+        stats = await youtube_analyzer.get_recent_video_stats(channel_id)
+        if not stats.get("error"):
+            result_cache.set(f"health:{channel_id}", stats)
     if not stats.get("error"):
         buf = create_activity_graphs(stats['views_list'], stats['likes_list'], stats['comments_list'])
         if buf: await cb.message.answer_photo(BufferedInputFile(buf.getvalue(), filename="graph.png"))
@@ -524,7 +527,12 @@ async def cb_show_graphs(cb: types.CallbackQuery):
 async def cb_show_heatmap(cb: types.CallbackQuery):
     channel_id = cb.data.split(":")[-1]
     await cb.answer("🔥 Анализирую...")
-    data = await youtube_analyzer.get_publication_heatmap_data(channel_id)
+    data = result_cache.get(f"heatmap:{channel_id}")
+    if data is None:
+        # Список последних видео уже в локальной базе после анализа канала
+        data = await youtube_analyzer.get_publication_heatmap_data(channel_id)
+        if not data.get("error"):
+            result_cache.set(f"heatmap:{channel_id}", data)
     if not data.get("error"):
         buf = create_heatmap_graph(data['grid'])
         if buf: await cb.message.answer_photo(BufferedInputFile(buf.getvalue(), filename="heatmap.png"), caption=data['report'], parse_mode="HTML")
@@ -541,23 +549,12 @@ async def process_channel_link(message: types.Message, state: FSMContext):
 
 @dp.message(UserStates.waiting_for_all_titles_link)
 async def process_all_titles(message: types.Message, state: FSMContext):
-    msg = await message.answer("⏳ Собираю заголовки...")
-    res = await youtube_analyzer.get_all_video_titles(message.text)
-    if res.get("error"):
-        await msg.edit_text(f"❌ {res['error']}")
+    admission_error = youtube_analyzer.check_admission('titles_export')
+    if admission_error:
+        await message.answer(f"❌ {admission_error}")
         return
-    
-    titles = res['titles']
-    if not titles:
-        await msg.edit_text("Видео не найдены.")
+    if await enqueue_job(message, 'titles_export', "Сбор заголовков", export_titles_job, channel_input=message.text):
         await state.clear()
-        return
-
-    text = f"Всего: {len(titles)}\n\n" + "\n".join(titles)
-    file = BufferedInputFile(text.encode('utf-8'), filename=f"titles.txt")
-    await msg.delete()
-    await message.answer_document(file, caption=f"✅ Готово: {len(titles)}")
-    await state.clear()
 
 @dp.message(UserStates.waiting_for_trends_query)
 async def process_trends(message: types.Message, state: FSMContext):
@@ -584,23 +581,22 @@ async def finish_excel(message: types.Message, state: FSMContext):
     data = await state.get_data()
     channels = data.get('channels', [])
     if not channels:
-        await message.answer("Нет данных.", reply_markup=get_main_keyboard())
         await state.clear()
+        await message.answer("Нет данных.", reply_markup=get_main_keyboard())
         return
     
-    msg = await message.answer("⏳ Генерирую Excel...", reply_markup=ReplyKeyboardRemove())
-    gen = ExcelGenerator(data['niche_name'])
-    for ch in channels: gen.add_channel_data(ch['category'], ch)
-    
-    file = BufferedInputFile(gen.save_to_buffer().getvalue(), filename=f"{data['niche_name']}.xlsx")
-    await msg.delete()
-    await message.answer_document(file, caption="Ваш анализ готов.")
+    job = await enqueue_job(message, 'excel', "Генерация Excel", build_excel_job, reply_markup=ReplyKeyboardRemove(),
+                            niche_name=data['niche_name'], channels=channels)
+    if job is None:
+        # Собранные каналы остаются в состоянии: файл можно запросить еще раз, когда очередь освободится
+        await message.answer(f"💾 Каналы ({len(channels)}) сохранены — нажмите «💾 Готово и Скачать» позже.")
+        return
     await state.clear()
 
 @dp.message(UserStates.niche_analysis)
 async def process_niche_channel(message: types.Message, state: FSMContext):
     msg = await message.answer("🔍 Анализ...")
-    data = await youtube_analyzer.analyze_channel(message.text)
+    data = await youtube_analyzer.analyze_channel(message.text, fields={'title', 'subscriber_count', 'view_count'})
     if data.get("error"):
         await msg.edit_text(f"❌ {data['error']}")
         return
@@ -608,10 +604,13 @@ async def process_niche_channel(message: types.Message, state: FSMContext):
     subs = int(data.get('subscriber_count', 0) or 0)
     cat = 'whales' if subs >= 100000 else 'small' if subs >= 1000 else 'tiny'
     
-    # Собираем данные
-    idea_7d = await youtube_analyzer.get_most_popular_video_in_range(data['channel_id'], 7)
-    idea_14d = await youtube_analyzer.get_most_popular_video_in_range(data['channel_id'], 14)
-    idea_30d = await youtube_analyzer.get_most_popular_video_in_range(data['channel_id'], 30)
+    # Собираем данные (при нехватке квоты — без идей, только основные цифры)
+    quota_warning = youtube_analyzer.check_admission('niche_ideas')
+    if quota_warning:
+        idea_7d = idea_14d = idea_30d = "N/A"
+    else:
+        ideas = await youtube_analyzer.get_top_videos_by_windows(data['channel_id'], (7, 14, 30))
+        idea_7d, idea_14d, idea_30d = ideas[7], ideas[14], ideas[30]
     
     st_data = await state.get_data()
     channels = st_data.get('channels', [])
@@ -620,7 +619,10 @@ async def process_niche_channel(message: types.Message, state: FSMContext):
         'views': int(data.get('view_count', 0)), 'idea_7d': idea_7d, 'idea_14d': idea_14d, 'idea_30d': idea_30d
     })
     await state.update_data(channels=channels)
-    await msg.edit_text(f"✅ Добавлен: {data['title']}. Всего: {len(channels)}.", parse_mode="HTML")
+    text = f"✅ Добавлен: {data['title']}. Всего: {len(channels)}."
+    if quota_warning:
+        text += f"\n⚠️ {quota_warning}"
+    await msg.edit_text(text, parse_mode="HTML")
 
 
 # --- УМНЫЙ ОБРАБОТЧИК (В САМОМ КОНЦЕ!) ---
@@ -647,9 +649,26 @@ async def start_web_server():
 
 async def main():
     logging.info("🚀 Bot started")
+    await http_clients.startup()
+    jobs.start()
     await start_web_server()
+    resumed = await jobs.resume(JOB_HANDLERS)
+    if resumed:
+        logging.info(f"Возобновлено фоновых задач: {resumed}")
+    try:
+        await youtube_analyzer.load_categories()
+    except Exception as e:
+        logging.warning(f"Не удалось загрузить категории видео: {e}")
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await jobs.stop()
+        await http_clients.shutdown()
+        # Несохраненный расход квоты записывается на диск
+        youtube_analyzer.quota.flush()
+        youtube_analyzer.api_cache.flush()
+        await dp.storage.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
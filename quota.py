@@ -0,0 +1,125 @@
+# quota.py
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+except Exception:
+    # Нет базы часовых поясов (tzdata) — используем фиксированное смещение PST
+    QUOTA_TIMEZONE = datetime.timezone(datetime.timedelta(hours=-8))
+
+# Стоимость методов YouTube Data API v3 в единицах квоты
+QUOTA_COSTS = {
+    'search.list': 100,
+    'videos.list': 1,
+    'channels.list': 1,
+    'playlistItems.list': 1,
+    'videoCategories.list': 1,
+}
+
+# Как часто (секунды) счетчики квоты из памяти записываются в SQLite
+FLUSH_INTERVAL = 10
+
+
+class QuotaLedger:
+    """
+    Учет израсходованной квоты YouTube Data API по дням.
+    Сутки считаются по тихоокеанскому времени — в полночь PT квота обнуляется.
+
+    Счетчики текущих суток живут в памяти (загружаются из SQLite при старте),
+    поэтому списание квоты на каждом запросе не трогает диск. В SQLite они
+    сбрасываются в фоновом потоке не чаще раза в FLUSH_INTERVAL секунд
+    (и сразу — когда ключ исчерпан), чтобы переживать перезапуски контейнера.
+    """
+
+    def __init__(self, db_path: str, daily_limit: int):
+        self.daily_limit = daily_limit
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS quota_usage ("
+            " day TEXT NOT NULL,"
+            " api_key TEXT NOT NULL,"
+            " units INTEGER NOT NULL,"
+            " PRIMARY KEY (day, api_key))"
+        )
+        self._conn.commit()
+        # (day, api_key) -> units; в _dirty — счетчики, еще не записанные на диск
+        self._usage: dict[tuple[str, str], int] = {
+            (day, api_key): units for day, api_key, units in self._conn.execute(
+                "SELECT day, api_key, units FROM quota_usage WHERE day = ?", (self._today(),)
+            )
+        }
+        self._dirty: set[tuple[str, str]] = set()
+        self._last_flush = time.monotonic()
+        self._flush_pending = False
+        self._flush_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quota-flush")
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+    @staticmethod
+    def cost(method: str) -> int:
+        return QUOTA_COSTS.get(method, 1)
+
+    def _schedule_flush(self, force: bool = False) -> None:
+        """Запускает запись счетчиков в фоне, если подошло время. Вызывается под self._lock."""
+        if self._flush_pending or not (force or time.monotonic() - self._last_flush >= FLUSH_INTERVAL):
+            return
+        self._flush_pending = True
+        self._flush_executor.submit(self.flush)
+
+    def flush(self) -> None:
+        """Записывает измененные счетчики в SQLite (синхронно; при остановке бота вызывается напрямую)."""
+        with self._lock:
+            rows = [(day, api_key, self._usage[(day, api_key)]) for day, api_key in self._dirty]
+            self._dirty.clear()
+            self._last_flush = time.monotonic()
+            self._flush_pending = False
+            # Прошедшие сутки в памяти больше не нужны
+            today = self._today()
+            for key in [key for key in self._usage if key[0] != today]:
+                del self._usage[key]
+        if not rows:
+            return
+        with self._db_lock:
+            self._conn.executemany(
+                "INSERT INTO quota_usage (day, api_key, units) VALUES (?, ?, ?) "
+                "ON CONFLICT(day, api_key) DO UPDATE SET units = MAX(units, excluded.units)",
+                rows
+            )
+            self._conn.commit()
+
+    def charge(self, method: str, api_key: str = "default") -> int:
+        units = self.cost(method)
+        key = (self._today(), api_key)
+        with self._lock:
+            self._usage[key] = self._usage.get(key, 0) + units
+            self._dirty.add(key)
+            self._schedule_flush()
+        return units
+
+    def used(self, api_key: str = "default") -> int:
+        with self._lock:
+            return self._usage.get((self._today(), api_key), 0)
+
+    def mark_exhausted(self, api_key: str = "default") -> None:
+        """API ответил quotaExceeded — считаем квоту ключа израсходованной до конца суток."""
+        key = (self._today(), api_key)
+        with self._lock:
+            self._usage[key] = max(self._usage.get(key, 0), self.daily_limit)
+            self._dirty.add(key)
+            self._schedule_flush(force=True)
+
+    def remaining(self, api_key: str = "default") -> int:
+        return max(self.daily_limit - self.used(api_key), 0)
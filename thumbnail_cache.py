@@ -0,0 +1,231 @@
+# thumbnail_cache.py
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from config import DATA_DIR, THUMB_CACHE_MB, THUMB_CACHE_TTL, THUMB_MISSING_TTL
+from http_clients import http_clients
+
+# Качества превью от лучшего к запасному (maxresdefault есть не у всех видео)
+THUMBNAIL_QUALITIES = ('maxresdefault', 'hqdefault')
+# Как часто (секунды) вычищать из индекса просроченные записи
+PURGE_INTERVAL = 3600
+
+
+def thumbnail_url(video_id: str, quality: str) -> str:
+    return f"https://img.youtube.com/vi/{video_id}/{quality}.jpg"
+
+
+class ThumbnailCache:
+    """
+    Локальный кэш превью, общий для всех пользователей и задач.
+
+    Картинки хранятся по SHA-256 содержимого (одинаковые файлы лежат на диске один раз),
+    индекс (video_id, quality) -> хэш — в SQLite. Там же запоминается, каких качеств
+    у видео нет, чтобы не повторять запрос maxresdefault, заведомо отвечающий 404.
+    Превью актуально ttl секунд, отметка об отсутствии качества — missing_ttl секунд;
+    просроченные записи считаются промахом и периодически удаляются.
+    Объем ограничен max_bytes: при переполнении удаляются давно не читанные превью.
+    Методы блокирующие (SQLite и файлы): из event loop вызывается только fetch.
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int,
+                 ttl: int = THUMB_CACHE_TTL, missing_ttl: int = THUMB_MISSING_TTL):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.missing_ttl = missing_ttl
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root_dir, "index.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            " video_id TEXT NOT NULL,"
+            " quality TEXT NOT NULL,"
+            " sha256 TEXT,"  # NULL — такого качества у видео нет
+            " size INTEGER NOT NULL DEFAULT 0,"
+            " accessed_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (video_id, quality));"
+            "CREATE INDEX IF NOT EXISTS idx_thumbnails_accessed ON thumbnails (accessed_at);"
+            "CREATE INDEX IF NOT EXISTS idx_thumbnails_expires ON thumbnails (expires_at);"
+        )
+        self._conn.commit()
+        self._last_purge = 0.0
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM thumbnails WHERE sha256 IS NOT NULL)"
+        ).fetchone()[0]
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root_dir, sha256[:2], f"{sha256}.jpg")
+
+    def _lookup(self, video_id: str, quality: str) -> tuple | None:
+        """(sha256,) из индекса; sha256 = None означает, что качества нет. None — неизвестно или просрочено."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sha256 FROM thumbnails WHERE video_id = ? AND quality = ? AND expires_at > ?",
+                (video_id, quality, now)
+            ).fetchone()
+            if row:
+                self._conn.execute(
+                    "UPDATE thumbnails SET accessed_at = ? WHERE video_id = ? AND quality = ?",
+                    (now, video_id, quality)
+                )
+                self._conn.commit()
+        return row
+
+    def _read_blob(self, sha256: str) -> bytes | None:
+        try:
+            with open(self._blob_path(sha256), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _get_cached(self, video_id: str, quality: str) -> tuple[bool, bytes | None]:
+        """(True, data) — ответ из кэша (data = None: качества нет), (False, None) — промах."""
+        row = self._lookup(video_id, quality)
+        if row:
+            if row[0] is None:
+                return True, None
+            data = self._read_blob(row[0])
+            if data is not None:
+                return True, data
+        return False, None
+
+    def get(self, video_id: str, quality: str) -> bytes | None:
+        return self._get_cached(video_id, quality)[1]
+
+    def _previous(self, video_id: str, quality: str) -> tuple | None:
+        """(sha256, size) записи, которую заменит новая."""
+        return self._conn.execute(
+            "SELECT sha256, size FROM thumbnails WHERE video_id = ? AND quality = ?", (video_id, quality)
+        ).fetchone()
+
+    def put(self, video_id: str, quality: str, data: bytes) -> None:
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha256)
+        now = time.time()
+        with self._lock:
+            previous = self._previous(video_id, quality)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                self._total_bytes += len(data)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (video_id, quality, sha256, size, accessed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, quality, sha256, len(data), now, now + self.ttl)
+            )
+            if previous and previous[0] and previous[0] != sha256:
+                # Автор заменил превью — старая картинка может быть больше не нужна
+                self._release_blob(*previous)
+            self._maintain(now)
+            self._conn.commit()
+
+    def mark_missing(self, video_id: str, quality: str) -> None:
+        now = time.time()
+        with self._lock:
+            previous = self._previous(video_id, quality)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (video_id, quality, sha256, size, accessed_at, expires_at) "
+                "VALUES (?, ?, NULL, 0, ?, ?)",
+                (video_id, quality, now, now + self.missing_ttl)
+            )
+            if previous and previous[0]:
+                self._release_blob(*previous)
+            self._maintain(now)
+            self._conn.commit()
+
+    def _release_blob(self, sha256: str, size: int) -> None:
+        """Удаляет файл превью, если на него больше не ссылается ни одна запись индекса."""
+        still_used = self._conn.execute(
+            "SELECT 1 FROM thumbnails WHERE sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone()
+        if not still_used:
+            try:
+                os.remove(self._blob_path(sha256))
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= size
+
+    def _maintain(self, now: float) -> None:
+        """Раз в PURGE_INTERVAL удаляет просроченные записи, при переполнении — давно не читанные превью."""
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self._last_purge = now
+            self._purge_expired(now)
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def _purge_expired(self, now: float) -> None:
+        """Удаляет просроченные записи, включая отметки об отсутствующих качествах."""
+        blobs = self._conn.execute(
+            "SELECT DISTINCT sha256, size FROM thumbnails WHERE expires_at <= ? AND sha256 IS NOT NULL", (now,)
+        ).fetchall()
+        self._conn.execute("DELETE FROM thumbnails WHERE expires_at <= ?", (now,))
+        for sha256, size in blobs:
+            self._release_blob(sha256, size)
+
+    def _evict(self) -> None:
+        """Удаляет давно не читанные превью, пока кэш не уменьшится до 90% лимита."""
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute(
+            "SELECT video_id, quality, sha256, size FROM thumbnails "
+            "WHERE sha256 IS NOT NULL ORDER BY accessed_at"
+        ).fetchall()
+        for video_id, quality, sha256, size in rows:
+            if self._total_bytes <= target:
+                break
+            self._conn.execute(
+                "DELETE FROM thumbnails WHERE video_id = ? AND quality = ?", (video_id, quality)
+            )
+            self._release_blob(sha256, size)
+
+    async def fetch(self, video_id: str, quality: str, url: str | None = None) -> bytes | None:
+        """
+        Превью одного качества: из кэша или по сети (с сохранением в кэш).
+        None — качества нет (404, запоминается) или картинка не скачалась.
+        Работа с индексом и файлами идет в потоке, не блокируя event loop.
+        """
+        found, data = await asyncio.to_thread(self._get_cached, video_id, quality)
+        if found:
+            self.hits += 1
+            return data
+        self.misses += 1
+        resp = await http_clients.get('thumbnails').get(url or thumbnail_url(video_id, quality))
+        if resp.status_code == 200:
+            await asyncio.to_thread(self.put, video_id, quality, resp.content)
+            return resp.content
+        if resp.status_code == 404:
+            await asyncio.to_thread(self.mark_missing, video_id, quality)
+        return None
+
+    async def fetch_best(self, video_id: str, qualities: tuple = THUMBNAIL_QUALITIES) -> bytes | None:
+        """Лучшее доступное качество из qualities (по порядку)."""
+        for quality in qualities:
+            data = await self.fetch(video_id, quality)
+            if data is not None:
+                return data
+        return None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": f"{self.hits / total * 100:.1f}" if total else "0.0",
+            "size_mb": f"{self._total_bytes / 1024 / 1024:.1f}"
+        }
+
+
+thumbnail_cache = ThumbnailCache(os.path.join(DATA_DIR, "thumbnails"), max_bytes=THUMB_CACHE_MB * 1024 * 1024)
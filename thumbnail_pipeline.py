@@ -0,0 +1,145 @@
+# thumbnail_pipeline.py
+
+import asyncio
+import io
+import zipfile
+from typing import AsyncIterable, Awaitable, Callable, Iterable
+
+from config import THUMB_DOWNLOAD_CONCURRENCY, ARCHIVE_MAX_BYTES, ARCHIVE_MAX_FILES
+from thumbnail_cache import thumbnail_cache
+
+
+def thumbnail_filename(video_id: str, title: str) -> str:
+    """Имя файла в архиве: очищенное название + ID видео (ID делает имя уникальным)."""
+    safe_title = "".join([c for c in title if c.isalpha() or c.isdigit() or c == ' ']).strip()
+    safe_title = safe_title[:50] or "img"
+    return f"{safe_title}_{video_id}.jpg"
+
+
+class ThumbnailArchive:
+    """
+    ZIP-архив в памяти, заполняемый до лимитов Telegram.
+    Файлы пишутся без сжатия: JPEG все равно не сжимается.
+    """
+
+    def __init__(self, part_num: int):
+        self.part_num = part_num
+        self.buffer = io.BytesIO()
+        self._zip = zipfile.ZipFile(self.buffer, 'w', zipfile.ZIP_STORED)
+        self.files = 0
+        self.video_ids: list[str] = []
+
+    def fits(self, size: int) -> bool:
+        return self.files < ARCHIVE_MAX_FILES and self.buffer.tell() + size <= ARCHIVE_MAX_BYTES
+
+    def add(self, video_id: str, filename: str, data: bytes) -> None:
+        self._zip.writestr(filename, data)
+        self.files += 1
+        self.video_ids.append(video_id)
+
+    def close(self) -> io.BytesIO:
+        self._zip.close()
+        self.buffer.seek(0)
+        return self.buffer
+
+
+class ThumbnailPipeline:
+    """
+    Конвейер скачивания превью без временных файлов на диске.
+
+    Записи видео (dict с 'id' и 'title') раздаются пулу из concurrency загрузчиков,
+    превью берутся через общий кэш (thumbnail_cache) и сразу дописываются
+    в текущий архив в памяти. Заполненный архив отдается
+    в on_archive(buffer, part_num, files_count, total_downloaded, video_ids) и отправляется в фоне,
+    пока заполняется следующий; следующий архив ждет завершения предыдущей отправки,
+    поэтому в памяти одновременно не больше двух архивов.
+    on_progress(processed) — необязательная корутина, вызываемая после каждого видео.
+
+    Если источник записей оборвался с ошибкой, уже скачанные превью все равно
+    упаковываются и отправляются, и только после этого ошибка пробрасывается вызывающему.
+
+    Для продолжения прерванной выгрузки: skip_ids — видео из уже отправленных архивов
+    (они пропускаются, но учитываются в счетчиках), first_part — номер следующего архива.
+    """
+
+    def __init__(self, on_archive: Callable[..., Awaitable[None]],
+                 on_progress: Callable[[int], Awaitable[None]] | None = None,
+                 concurrency: int = THUMB_DOWNLOAD_CONCURRENCY,
+                 skip_ids: set[str] | None = None, first_part: int = 1):
+        self.on_archive = on_archive
+        self.on_progress = on_progress
+        self.concurrency = concurrency
+        self.skip_ids = skip_ids or set()
+        self.processed = 0
+        self.downloaded = len(self.skip_ids)
+        self._archive = ThumbnailArchive(part_num=first_part)
+        self._write_lock = asyncio.Lock()
+        self._upload_task: asyncio.Task | None = None
+
+    async def _flush(self) -> None:
+        """Закрывает текущий архив и запускает его отправку, дождавшись предыдущей."""
+        archive = self._archive
+        self._archive = ThumbnailArchive(part_num=archive.part_num + 1)
+        if self._upload_task:
+            await self._upload_task
+        self._upload_task = asyncio.create_task(
+            self.on_archive(archive.close(), archive.part_num, archive.files, self.downloaded, archive.video_ids)
+        )
+
+    async def _add(self, video_id: str, filename: str, data: bytes) -> None:
+        async with self._write_lock:
+            if self._archive.files and not self._archive.fits(len(data)):
+                await self._flush()
+            self._archive.add(video_id, filename, data)
+            self.downloaded += 1
+
+    async def _worker(self, queue: asyncio.Queue) -> None:
+        while (entry := await queue.get()) is not None:
+            video_id = entry.get('id')
+            data = None
+            if video_id and video_id not in self.skip_ids:
+                try:
+                    data = await thumbnail_cache.fetch_best(video_id)
+                except Exception:
+                    pass  # Пропускаем, если картинка не скачалась
+            if data:
+                await self._add(video_id, thumbnail_filename(video_id, entry.get('title') or 'video'), data)
+            self.processed += 1
+            if self.on_progress:
+                await self.on_progress(self.processed)
+
+    async def run(self, entries: Iterable[dict] | AsyncIterable[dict]) -> int:
+        """Обрабатывает все записи и отправляет последний архив. Возвращает число скачанных превью."""
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        source_error: Exception | None = None
+        try:
+            try:
+                if hasattr(entries, '__aiter__'):
+                    async for entry in entries:
+                        await queue.put(entry)
+                else:
+                    for entry in entries:
+                        await queue.put(entry)
+            except Exception as e:
+                # Листинг оборвался: доделываем уже полученные записи и отправляем последний архив
+                source_error = e
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+
+            if self._archive.files:
+                await self._flush()
+            if self._upload_task:
+                await self._upload_task
+        finally:
+            # Источник записей закрывается сразу, а не при сборке мусора (останавливает листинг)
+            if hasattr(entries, 'aclose'):
+                await entries.aclose()
+            for worker in workers:
+                worker.cancel()
+            if self._upload_task and not self._upload_task.done():
+                self._upload_task.cancel()
+        if source_error:
+            raise source_error
+        return self.downloaded
@@ -0,0 +1,194 @@
+# video_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class VideoStore:
+    """
+    Локальная SQLite-база видео каналов: ID, название, дата публикации,
+    превью и последняя известная статистика.
+    Для каждого канала хранится состояние синхронизации плейлиста загрузок:
+    complete = 1 означает, что в базе есть вся история канала, и новые
+    загрузки можно дочитывать инкрементально — до первого уже известного видео.
+    resume_page_token — страница, с которой продолжить прерванное полное чтение плейлиста,
+    pass_started_at — начало текущего полного чтения: видео, не встреченные в нем
+    (last_seen_at раньше этого момента), по его завершении удаляются как удаленные/скрытые.
+    Методы блокирующие: из event loop они вызываются через asyncio.to_thread.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS videos ("
+            " video_id TEXT PRIMARY KEY,"
+            " channel_id TEXT NOT NULL,"
+            " title TEXT NOT NULL,"
+            " published_at TEXT NOT NULL,"
+            " thumbnails TEXT NOT NULL DEFAULT '{}',"
+            " views INTEGER,"
+            " likes INTEGER,"
+            " comments INTEGER,"
+            " stats_updated_at REAL,"
+            " last_seen_at REAL);"
+            "CREATE INDEX IF NOT EXISTS idx_videos_channel_published"
+            " ON videos (channel_id, published_at DESC, video_id DESC);"
+            "CREATE TABLE IF NOT EXISTS channel_sync ("
+            " channel_id TEXT PRIMARY KEY,"
+            " complete INTEGER NOT NULL DEFAULT 0,"
+            " synced_at REAL NOT NULL DEFAULT 0,"
+            " full_synced_at REAL NOT NULL DEFAULT 0,"
+            " resume_page_token TEXT,"
+            " pass_started_at REAL NOT NULL DEFAULT 0);"
+        )
+        self._conn.commit()
+
+    # --- Состояние синхронизации ---
+
+    def get_sync_state(self, channel_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT complete, synced_at, full_synced_at, pass_started_at FROM channel_sync WHERE channel_id = ?",
+                (channel_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def set_sync_state(self, channel_id: str, complete: bool, full: bool = False) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO channel_sync (channel_id, complete, synced_at, full_synced_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(channel_id) DO UPDATE SET complete = excluded.complete, synced_at = excluded.synced_at, "
+                "full_synced_at = CASE WHEN ? THEN excluded.full_synced_at ELSE full_synced_at END",
+                (channel_id, int(complete), now, now if full else 0, int(full))
+            )
+            self._conn.commit()
+
+    def get_resume_token(self, channel_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT resume_page_token FROM channel_sync WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+        return row['resume_page_token'] if row else None
+
+    def set_resume_token(self, channel_id: str, page_token: str | None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO channel_sync (channel_id, resume_page_token) VALUES (?, ?) "
+                "ON CONFLICT(channel_id) DO UPDATE SET resume_page_token = excluded.resume_page_token",
+                (channel_id, page_token)
+            )
+            self._conn.commit()
+
+    def start_full_pass(self, channel_id: str) -> float:
+        """Отмечает начало полного чтения плейлиста с первой страницы. Возвращает его время."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO channel_sync (channel_id, pass_started_at) VALUES (?, ?) "
+                "ON CONFLICT(channel_id) DO UPDATE SET pass_started_at = excluded.pass_started_at",
+                (channel_id, now)
+            )
+            self._conn.commit()
+        return now
+
+    # --- Запись ---
+
+    def known_ids(self, channel_id: str, video_ids: list) -> set:
+        if not video_ids:
+            return set()
+        placeholders = ",".join("?" * len(video_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT video_id FROM videos WHERE channel_id = ? AND video_id IN ({placeholders})",
+                (channel_id, *video_ids)
+            ).fetchall()
+        return {row['video_id'] for row in rows}
+
+    def upsert_videos(self, channel_id: str, videos: list) -> None:
+        """videos — список словарей с ключами video_id, title, published_at, thumbnails."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO videos (video_id, channel_id, title, published_at, thumbnails, last_seen_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(video_id) DO UPDATE SET title = excluded.title, "
+                "published_at = excluded.published_at, thumbnails = excluded.thumbnails, "
+                "last_seen_at = excluded.last_seen_at",
+                [(v['video_id'], channel_id, v['title'], v['published_at'], json.dumps(v['thumbnails']), now)
+                 for v in videos]
+            )
+            self._conn.commit()
+
+    def delete_unseen(self, channel_id: str, since: float) -> int:
+        """Удаляет видео канала, не встреченные в плейлисте с момента since. Возвращает их количество."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM videos WHERE channel_id = ? AND (last_seen_at IS NULL OR last_seen_at < ?)",
+                (channel_id, since)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def update_stats(self, items: list) -> None:
+        """Сохраняет статистику из ответа videos.list (part=statistics)."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE videos SET views = ?, likes = ?, comments = ?, stats_updated_at = ? WHERE video_id = ?",
+                [(int(item.get('statistics', {}).get('viewCount', 0)),
+                  int(item.get('statistics', {}).get('likeCount', 0)),
+                  int(item.get('statistics', {}).get('commentCount', 0)),
+                  now, item['id']) for item in items]
+            )
+            self._conn.commit()
+
+    # --- Чтение ---
+
+    @staticmethod
+    def _row_to_video(row: sqlite3.Row) -> dict:
+        video = dict(row)
+        video['thumbnails'] = json.loads(video['thumbnails'])
+        return video
+
+    def recent_videos(self, channel_id: str, limit: int, since: str | None = None) -> list:
+        """Последние видео канала (от новых к старым), опционально не старше since (ISO 8601)."""
+        query = "SELECT * FROM videos WHERE channel_id = ?"
+        params = [channel_id]
+        if since:
+            query += " AND published_at >= ?"
+            params.append(since)
+        query += " ORDER BY published_at DESC, video_id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._row_to_video(row) for row in rows]
+
+    def iter_video_pages(self, channel_id: str, page_size: int = 500):
+        """Все видео канала страницами (от новых к старым), без загрузки всего списка в память."""
+        cursor = None
+        while True:
+            with self._lock:
+                if cursor is None:
+                    rows = self._conn.execute(
+                        "SELECT * FROM videos WHERE channel_id = ? "
+                        "ORDER BY published_at DESC, video_id DESC LIMIT ?",
+                        (channel_id, page_size)
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT * FROM videos WHERE channel_id = ? AND (published_at, video_id) < (?, ?) "
+                        "ORDER BY published_at DESC, video_id DESC LIMIT ?",
+                        (channel_id, *cursor, page_size)
+                    ).fetchall()
+            if not rows:
+                break
+            yield [self._row_to_video(row) for row in rows]
+            cursor = (rows[-1]['published_at'], rows[-1]['video_id'])
@@ -2,15 +2,59 @@
 
 import asyncio
 import datetime
+import hashlib
+import json
+import os
 import re
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
-import httpx
+import httplib2
 import numpy as np
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+from config import (
+    YOUTUBE_API_KEYS, YOUTUBE_API_WORKERS, YOUTUBE_API_TIMEOUT,
+    YOUTUBE_CATEGORY_REGIONS, CATEGORY_CACHE_TTL,
+    VIDEO_BATCH_WINDOW_MS, RYD_DEADLINE, CATEGORY_DEADLINE, COUNTRY_NAMES_LANG, YOUTUBE_DAILY_QUOTA, QUOTA_EXPENSIVE_THRESHOLD,
+    DATA_DIR, CHANNEL_INDEX_TTL, VIDEO_STORE_FULL_RESYNC_DAYS, VIDEO_STORE_FRESHNESS,
+    API_CACHE_MEMORY_ITEMS, API_CACHE_DISK_MB, API_CACHE_TTL_VIDEOS, API_CACHE_TTL_CHANNELS,
+    API_CACHE_TTL_SEARCH, API_CACHE_TTL_CATEGORIES,
+    SPOOL_MAX_MEMORY, THUMB_DOWNLOAD_CONCURRENCY
+)
+from async_utils import MicroBatcher, SingleFlight, with_deadline
+from cache import ApiCache
+from channel_index import ChannelResolutionIndex
+from countries import get_country_label
+from http_clients import http_clients
+from quota import QuotaLedger
+from thumbnail_cache import thumbnail_cache
+from video_store import VideoStore
+
+# Операции, которые съедают много квоты и отключаются первыми при ее нехватке
+EXPENSIVE_OPERATIONS = {
+    'titles_export': "выгрузка всех названий",
+    'thumbnails_zip': "скачивание превью через API",
+    'niche_ideas': "поиск популярных видео для Excel",
+}
+
+# Время жизни закэшированных ответов по методам Data API
+API_CACHE_TTLS = {
+    'videos.list': API_CACHE_TTL_VIDEOS,
+    'channels.list': API_CACHE_TTL_CHANNELS,
+    'search.list': API_CACHE_TTL_SEARCH,
+    'videoCategories.list': API_CACHE_TTL_CATEGORIES,
+}
+
+# Поля результата analyze_channel и части ответа API, которые за ними стоят
+CHANNEL_SNIPPET_FIELDS = {'title', 'published_at'}
+CHANNEL_STATISTICS_FIELDS = {'video_count', 'view_count', 'subscriber_count'}
+CHANNEL_HEALTH_FIELDS = {'avg_views', 'avg_likes', 'avg_comments', 'er'}
 
-from config import YOUTUBE_API_KEY
-import zipfile
-import io
 
 class YouTubeAnalyzer:
     """
@@ -19,14 +63,200 @@ class YouTubeAnalyzer:
     """
 
     def __init__(self):
-        # Инициализация сервиса YouTube API
-        self.youtube = build('youtube', 'v3', developerKey=YOUTUBE_API_KEY)
+        # Инициализация сервисов YouTube API: по одному на каждый ключ.
+        # В учете квоты ключ фигурирует под коротким отпечатком, а не в открытом виде.
+        self._services = {
+            hashlib.sha256(key.encode()).hexdigest()[:12]: build('youtube', 'v3', developerKey=key)
+            for key in YOUTUBE_API_KEYS
+        }
+
+        # googleapiclient синхронный, поэтому запросы выполняются в отдельном
+        # ограниченном пуле потоков, а не в event loop бота.
+        # У каждого потока свой httplib2.Http (он не потокобезопасен) с keep-alive.
+        self._api_executor = ThreadPoolExecutor(
+            max_workers=YOUTUBE_API_WORKERS,
+            thread_name_prefix="youtube-api"
+        )
+        self._thread_local = threading.local()
+
+        # Учет расхода квоты Data API
+        self.quota = QuotaLedger(
+            os.path.join(DATA_DIR, "quota.sqlite3"),
+            daily_limit=YOUTUBE_DAILY_QUOTA
+        )
+
+        # Кэш ответов API: память + диск, переживает перезапуски
+        self.api_cache = ApiCache(
+            os.path.join(DATA_DIR, "api_cache.sqlite3"),
+            memory_items=API_CACHE_MEMORY_ITEMS,
+            disk_max_bytes=API_CACHE_DISK_MB * 1024 * 1024
+        )
+
+        # Одиночные запросы videos.list склеиваются в пакеты до 50 ID
+        self._video_batcher = MicroBatcher(
+            self._fetch_videos_batch,
+            window=VIDEO_BATCH_WINDOW_MS / 1000,
+            max_batch=50
+        )
+
+        # Одинаковые одновременные анализы видео/каналов выполняются один раз
+        self._singleflight = SingleFlight()
+
+        # Справочник категорий: category_id -> название (общий для всех регионов)
+        self._categories: dict[str, str] = {}
+        self._categories_loaded_at = 0.0
+        self._categories_lock = asyncio.Lock()
+
+        # ID плейлистов загрузок: channel_id -> playlist_id.
+        # В _verified_uploads — каналы, для которых ID подтвержден через API.
+        self._uploads_playlists: dict[str, str] = {}
+        self._verified_uploads: set[str] = set()
+
+        # Постоянный индекс @handle/username -> ID канала
+        self.channel_index = ChannelResolutionIndex(
+            os.path.join(DATA_DIR, "channel_index.sqlite3"),
+            ttl=CHANNEL_INDEX_TTL
+        )
+
+        # Локальная база видео каналов (инкрементальная синхронизация загрузок)
+        self.video_store = VideoStore(os.path.join(DATA_DIR, "videos.sqlite3"))
+
+    # --- Транспорт YouTube Data API ---
+
+    def _get_thread_http(self) -> httplib2.Http:
+        http = getattr(self._thread_local, 'http', None)
+        if http is None:
+            http = httplib2.Http(timeout=YOUTUBE_API_TIMEOUT)
+            self._thread_local.http = http
+        return http
+
+    def _execute_sync(self, request) -> dict:
+        return request.execute(http=self._get_thread_http())
+
+    @staticmethod
+    def _is_quota_error(error: HttpError) -> bool:
+        return error.resp.status == 403 and any(
+            reason in str(error.content) for reason in ('quotaExceeded', 'dailyLimitExceeded')
+        )
+
+    def _pick_key(self, exclude: set) -> str:
+        """Ключ с наибольшим остатком квоты среди еще не опробованных."""
+        candidates = [key_id for key_id in self._services if key_id not in exclude]
+        return max(candidates, key=self.quota.remaining)
+
+    @staticmethod
+    def _cache_key(method: str, params: dict) -> str:
+        return f"{method}:{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+
+    async def _api(self, method: str, **params) -> dict:
+        """
+        Выполняет метод Data API с кэшированием ответа.
+        Свежий ответ берется из кэша (память, затем диск) без расхода квоты;
+        одинаковые одновременные промахи выполняются одним запросом.
+        """
+        ttl = API_CACHE_TTLS.get(method, 0)
+        if not ttl:
+            return await self._api_call(method, **params)
+        key = self._cache_key(method, params)
+        entry = await self.api_cache.get(key)
+        if self.api_cache.is_fresh(entry):
+            return entry['payload']
+        return await self._singleflight.do(
+            f"api:{key}", lambda: self._api_refresh(method, key, ttl, params, entry)
+        )
+
+    async def _api_refresh(self, method: str, key: str, ttl: int, params: dict, stale: dict | None) -> dict:
+        """
+        Обновляет запись кэша. Если есть устаревший ответ с ETag, запрос отправляется
+        условным: на 304 Not Modified тело не передается, а старой записи продлевается срок.
+        """
+        etag = stale['etag'] if stale else None
+        try:
+            response = await self._api_call(method, etag=etag, **params)
+        except HttpError as e:
+            if etag is None or e.resp.status != 304:
+                raise
+            self.api_cache.touch(key, ttl)
+            return stale['payload']
+        self.api_cache.set(key, response, ttl, etag=response.get('etag'))
+        return response
+
+    async def _api_call(self, method: str, etag: str | None = None, **params) -> dict:
+        """
+        Выполняет метод Data API (например, 'videos.list') в пуле потоков,
+        не блокируя event loop. Ошибки googleapiclient пробрасываются как есть.
+        Запрос уходит через ключ с наибольшим остатком квоты; если ключ
+        ответил quotaExceeded, запрос повторяется через следующий.
+        С etag запрос отправляется с If-None-Match: неизмененный ответ
+        приходит как HttpError со статусом 304.
+        """
+        resource, action = method.split('.')
+        loop = asyncio.get_running_loop()
+        tried = set()
+        while True:
+            key_id = self._pick_key(tried)
+            service = self._services[key_id]
+            request = getattr(getattr(service, resource)(), action)(**params)
+            if etag:
+                request.headers['If-None-Match'] = etag
+            # Квота списывается и за неудачные запросы, поэтому учитываем ее заранее
+            self.quota.charge(method, key_id)
+            try:
+                return await loop.run_in_executor(self._api_executor, self._execute_sync, request)
+            except HttpError as e:
+                if not self._is_quota_error(e):
+                    raise
+                self.quota.mark_exhausted(key_id)
+                tried.add(key_id)
+                if len(tried) == len(self._services):
+                    raise
+
+    def check_admission(self, operation: str) -> str | None:
+        """
+        Контроль допуска перед запуском операции.
+        Возвращает текст ошибки, если операцию сейчас запускать нельзя, иначе None.
+        """
+        if operation not in EXPENSIVE_OPERATIONS:
+            return None
+        stats = self.quota_stats()
+        if stats['used'] >= stats['limit'] * QUOTA_EXPENSIVE_THRESHOLD:
+            return (f"Суточная квота YouTube API почти исчерпана, "
+                    f"операция «{EXPENSIVE_OPERATIONS[operation]}» временно недоступна. Попробуйте завтра.")
+        return None
+
+    def quota_stats(self) -> dict:
+        """Суммарный расход квоты по всем ключам за текущие сутки."""
+        used = sum(self.quota.used(key_id) for key_id in self._services)
+        limit = self.quota.daily_limit * len(self._services)
+        return {
+            "used": used,
+            "remaining": max(limit - used, 0),
+            "limit": limit,
+            "keys": len(self._services)
+        }
 
-        # Клиент для API Return YouTube Dislike
-        self.ryd_client = httpx.AsyncClient(
-            base_url="https://returnyoutubedislikeapi.com",
-            timeout=5.0
+    async def _fetch_videos_batch(self, part: str, video_ids: list) -> dict:
+        """
+        Один videos.list на пачку ID. Возвращает video_id -> item.
+        Пачки каждый раз разные, поэтому в кэш кладутся отдельные видео, а не ответ целиком.
+        """
+        response = await self._api_call('videos.list', part=part, id=",".join(video_ids))
+        items = {item['id']: item for item in response.get('items', [])}
+        self.api_cache.set_many(
+            {self._video_cache_key(part, video_id): item for video_id, item in items.items()}, API_CACHE_TTL_VIDEOS
         )
+        return items
+
+    def _video_cache_key(self, part: str, video_id: str) -> str:
+        return self._cache_key('videos.item', {'part': part, 'id': video_id})
+
+    def api_cache_stats(self) -> dict:
+        """Попадания в кэш ответов API (память/диск) и промахи."""
+        return self.api_cache.stats()
+
+    def singleflight_stats(self) -> dict:
+        """Сколько одинаковых одновременных запросов было схлопнуто в один."""
+        return self._singleflight.stats()
 
     # --- Утилитарные функции для извлечения ID ---
 
@@ -55,15 +285,15 @@ class YouTubeAnalyzer:
         # Очищаем от потенциально опасных символов
         text_input = text_input.strip()
         match_raw_handle = re.fullmatch(r'@([a-zA-Z0-9_.-]+)', text_input)
-        if match_raw_handle: return {'type': 'search_query', 'value': match_raw_handle.group(1)}
+        if match_raw_handle: return {'type': 'handle', 'value': match_raw_handle.group(1)}
         match_id = re.search(r'/channel/([a-zA-Z0-9_-]+)', text_input)
         if match_id: return {'type': 'id', 'value': match_id.group(1)}
         match_user = re.search(r'/user/([a-zA-Z0-9_-]+)', text_input)
         if match_user: return {'type': 'username', 'value': match_user.group(1)}
         match_handle = re.search(r'/@([a-zA-Z0-9_.-]+)', text_input)
-        if match_handle: return {'type': 'search_query', 'value': match_handle.group(1)}
+        if match_handle: return {'type': 'handle', 'value': match_handle.group(1)}
         match_custom = re.search(r'/c/([a-zA-Z0-9_.-]+)', text_input)
-        if match_custom: return {'type': 'search_query', 'value': match_custom.group(1)}
+        if match_custom: return {'type': 'custom', 'value': match_custom.group(1)}
         if not (text_input.startswith('http') or text_input.startswith('www.') or '/' in text_input):
             clean_input = text_input.replace('@', '').strip()
             if clean_input and len(clean_input) <= 100:  # Дополнительная проверка длины
@@ -74,7 +304,7 @@ class YouTubeAnalyzer:
 
     async def _get_ryd_dislikes(self, video_id: str) -> str:
         try:
-            response = await self.ryd_client.get(f"/votes?videoId={video_id}")
+            response = await http_clients.get('ryd').get("/votes", params={"videoId": video_id})
             response.raise_for_status()
             data = response.json()
             dislikes = data.get('dislikes', 'N/A')
@@ -82,15 +312,35 @@ class YouTubeAnalyzer:
         except Exception:
             return 'N/A'
 
+    async def load_categories(self, force: bool = False) -> None:
+        """
+        Загружает справочник категорий для всех регионов из YOUTUBE_CATEGORY_REGIONS.
+        Повторная загрузка происходит не чаще, чем раз в CATEGORY_CACHE_TTL.
+        """
+        async with self._categories_lock:
+            is_fresh = time.monotonic() - self._categories_loaded_at < CATEGORY_CACHE_TTL
+            if self._categories and is_fresh and not force:
+                return
+            responses = await asyncio.gather(*[
+                self._api('videoCategories.list', part="snippet", regionCode=region)
+                for region in YOUTUBE_CATEGORY_REGIONS
+            ])
+            table = {}
+            # Первый регион в списке имеет приоритет при совпадении ID
+            for response in reversed(responses):
+                for item in response.get('items', []):
+                    table[item['id']] = item['snippet']['title']
+            self._categories = table
+            self._categories_loaded_at = time.monotonic()
+
     async def _get_category_name(self, category_id: str) -> str:
         try:
-            request = self.youtube.videoCategories().list(part="snippet", regionCode="US")
-            response = request.execute()
-            for item in response['items']:
-                if item['id'] == category_id: return item['snippet']['title']
-            return "Неизвестно"
+            await self.load_categories()
         except Exception:
-            return "Ошибка загрузки категории"
+            # Если обновить не удалось, продолжаем работать со старым справочником
+            if not self._categories:
+                return "Ошибка загрузки категории"
+        return self._categories.get(category_id, "Неизвестно")
 
     def _get_best_thumbnail_url(self, thumbnails: dict) -> str | None:
         if 'maxres' in thumbnails: return thumbnails['maxres']['url']
@@ -108,16 +358,28 @@ class YouTubeAnalyzer:
         valid_chars = set(string.ascii_letters + string.digits + '_-')
         if not all(c in valid_chars for c in video_id):
             return {"error": "Неверный формат ID видео."}
+        return await self._singleflight.do(f"video:{video_id}", lambda: self._load_video_data(video_id))
+
+    async def _load_video_data(self, video_id: str) -> dict:
         try:
-            request = self.youtube.videos().list(part="snippet,statistics", id=video_id)
-            response = request.execute()
-            if not response.get('items'):
+            entry = await self.api_cache.get(self._video_cache_key("snippet,statistics", video_id))
+            if self.api_cache.is_fresh(entry):
+                item = entry['payload']
+            else:
+                item = await self._video_batcher.submit(video_id, group="snippet,statistics")
+            if not item:
                 return {"error": "Видео не найдено или недоступно."}
-            item = response['items'][0]
             snippet = item['snippet']
             stats = item.get('statistics', {})
             geo_info = snippet.get('countryCode', 'N/A')
-            dislike_count = await self._get_ryd_dislikes(video_id)
+            # Независимые обогащения идут параллельно, каждое со своим сроком:
+            # медленный сервис отдает "N/A" и не задерживает ответ
+            dislike_count, category_name = await asyncio.gather(
+                with_deadline(self._get_ryd_dislikes(video_id), RYD_DEADLINE, 'N/A'),
+                with_deadline(self._get_category_name(snippet['categoryId']), CATEGORY_DEADLINE, 'N/A')
+            )
+            # Название страны берется из встроенного справочника, без сетевого запроса
+            geo_label = get_country_label(geo_info, COUNTRY_NAMES_LANG)
             thumbnail_url = self._get_best_thumbnail_url(snippet.get('thumbnails', {}))
             # Очищаем потенциально опасные данные
             title = snippet['title'] if isinstance(snippet['title'], str) else 'N/A'
@@ -132,12 +394,11 @@ class YouTubeAnalyzer:
                 "url": f"https://www.youtube.com/watch?v={video_id}",
                 "published_at": snippet['publishedAt'], "category_id": snippet['categoryId'],
                 "description": description, "tags": tags,
-                "geo_code": geo_info, "views": stats.get('viewCount', '0'),
+                "geo_code": geo_info, "geo_info": geo_label, "views": stats.get('viewCount', '0'),
                 "likes": stats.get('likeCount', '0'), "dislikes": dislike_count,
-                "comments": stats.get('commentCount', '0'), "thumbnail_url": thumbnail_url
+                "comments": stats.get('commentCount', '0'), "thumbnail_url": thumbnail_url,
+                "category_name": category_name
             }
-            category_name = await self._get_category_name(data['category_id'])
-            data['category_name'] = category_name
             return data
         except Exception as e:
             return {"error": f"Ошибка при обращении к YouTube API: {str(e)}"}
@@ -157,27 +418,225 @@ class YouTubeAnalyzer:
 
     async def _get_channel_id_by_search(self, query: str) -> str | None:
         try:
-            request = self.youtube.search().list(part="snippet", q=query, type="channel", maxResults=1)
-            response = request.execute()
+            response = await self._api('search.list', part="snippet", q=query, type="channel", maxResults=1)
             if response.get('items'): return response['items'][0]['snippet']['channelId']
             return None
         except Exception:
             return None
 
-    async def _get_uploads_playlist_id(self, channel_id: str) -> str | None:
-        """Вспомогательная функция для получения ID плейлиста 'Uploads'."""
+    async def _get_channel_id_by_handle(self, handle: str) -> str | None:
+        """Поиск канала по @handle через channels.list (1 единица квоты вместо 100)."""
+        try:
+            response = await self._api('channels.list', part="id", forHandle=f"@{handle}")
+            if response.get('items'): return response['items'][0]['id']
+            return None
+        except Exception:
+            return None
+
+    async def _get_channel_id_by_username(self, username: str) -> str | None:
         try:
-            request_details = self.youtube.channels().list(
+            response = await self._api('channels.list', part="id", forUsername=username)
+            if response.get('items'): return response['items'][0]['id']
+            return None
+        except Exception:
+            return None
+
+    async def _resolve_channel_id(self, channel_info: dict) -> str | None:
+        """
+        Определяет ID канала по результату _extract_channel_info.
+        Сначала смотрит в постоянный индекс, затем пробует дешевые запросы
+        (forHandle / forUsername) и только в крайнем случае search.list.
+        """
+        alias_type, value = channel_info['type'], channel_info['value']
+        if alias_type == 'id':
+            return value
+
+        channel_id = self.channel_index.get(alias_type, value)
+        if channel_id:
+            return channel_id
+        return await self._singleflight.do(
+            f"resolve:{alias_type}:{value.lower()}",
+            lambda: self._lookup_channel_id(alias_type, value)
+        )
+
+    async def _lookup_channel_id(self, alias_type: str, value: str) -> str | None:
+        channel_id = None
+
+        if alias_type == 'username':
+            channel_id = await self._get_channel_id_by_username(value)
+        elif re.fullmatch(r'[a-zA-Z0-9_.-]{3,30}', value):
+            # Кастомные URL и простые названия часто совпадают с @handle канала
+            channel_id = await self._get_channel_id_by_handle(value)
+        if not channel_id:
+            channel_id = await self._get_channel_id_by_search(value)
+
+        if channel_id:
+            self.channel_index.put(alias_type, value, channel_id)
+        return channel_id
+
+    async def _fetch_uploads_playlist_id(self, channel_id: str) -> str | None:
+        """Запрашивает ID плейлиста 'Uploads' через channels.list."""
+        try:
+            response_details = await self._api(
+                'channels.list',
                 part="contentDetails",
                 id=channel_id
             )
-            response_details = request_details.execute()
             if not response_details.get('items'):
                 return None
             return response_details['items'][0]['contentDetails'].get('relatedPlaylists', {}).get('uploads')
         except Exception:
             return None
 
+    async def _get_uploads_playlist_id(self, channel_id: str) -> str | None:
+        """
+        Вспомогательная функция для получения ID плейлиста 'Uploads'.
+        Для ID вида UC... плейлист загрузок — это UU... с тем же хвостом,
+        поэтому он вычисляется без запроса к API и проверяется только при 404.
+        """
+        if channel_id in self._uploads_playlists:
+            return self._uploads_playlists[channel_id]
+        if re.fullmatch(r'UC[a-zA-Z0-9_-]{22}', channel_id):
+            uploads_id = 'UU' + channel_id[2:]
+        else:
+            uploads_id = await self._fetch_uploads_playlist_id(channel_id)
+            if not uploads_id:
+                return None
+            self._verified_uploads.add(channel_id)
+        self._uploads_playlists[channel_id] = uploads_id
+        return uploads_id
+
+    async def _list_uploads(self, channel_id: str, **params) -> dict:
+        """
+        playlistItems.list по плейлисту загрузок канала.
+        Если вычисленный ID плейлиста вернул 404, сверяет его с channels.list и повторяет запрос.
+        """
+        uploads_id = await self._get_uploads_playlist_id(channel_id)
+        try:
+            return await self._api('playlistItems.list', playlistId=uploads_id, **params)
+        except HttpError as e:
+            if e.resp.status != 404 or channel_id in self._verified_uploads:
+                raise
+            verified_id = await self._fetch_uploads_playlist_id(channel_id)
+            if not verified_id:
+                raise
+            self._uploads_playlists[channel_id] = verified_id
+            self._verified_uploads.add(channel_id)
+            if verified_id == uploads_id:
+                raise
+            return await self._api('playlistItems.list', playlistId=verified_id, **params)
+
+    # --- Локальная база видео канала ---
+
+    @staticmethod
+    def _playlist_item_to_video(item: dict) -> dict:
+        snippet = item['snippet']
+        content_details = item.get('contentDetails', {})
+        return {
+            "video_id": content_details.get('videoId') or snippet['resourceId']['videoId'],
+            "title": snippet['title'],
+            # У приватных/удаленных видео нет videoPublishedAt — берем дату добавления в плейлист
+            "published_at": content_details.get('videoPublishedAt') or snippet['publishedAt'],
+            "thumbnails": snippet.get('thumbnails', {})
+        }
+
+    async def sync_channel_uploads(self, channel_id: str, min_items: int | None = None,
+                                   since: str | None = None, on_progress=None,
+                                   max_age: float = 0) -> int:
+        """
+        Синхронизирует плейлист загрузок канала с локальной базой (от новых к старым).
+
+        Если в базе уже есть вся история канала, дочитывает только новые видео —
+        до первого известного ID (обычно одна страница). Иначе читает плейлист
+        целиком, либо, если указаны min_items/since, только пока не наберется
+        нужное количество последних видео / не будет достигнута дата since (ISO 8601).
+        on_progress — необязательная корутина, получающая число записанных в базу видео.
+        max_age — если канал синхронизировался не раньше max_age секунд назад, API не вызывается.
+        Полное чтение сохраняет токен следующей страницы после каждой страницы: если его прервал
+        перезапуск бота, следующая полная синхронизация продолжит с этой страницы. Видео,
+        не встреченные за полное чтение, удаляются из базы (удаленные и скрытые видео).
+        Состояние канала (complete, synced_at) меняется только при успешном завершении.
+        Возвращает количество прочитанных из API видео.
+        """
+        state = await asyncio.to_thread(self.video_store.get_sync_state, channel_id)
+        if max_age and state and time.time() - state['synced_at'] < max_age:
+            return 0
+        complete = bool(state and state['complete'])
+        partial = bool(min_items or since)
+        # Полная пересинхронизация нужна только выгрузкам всей истории,
+        # частичным запросам достаточно дочитать новые видео
+        full_resync_due = not state or time.time() - state['full_synced_at'] > VIDEO_STORE_FULL_RESYNC_DAYS * 86400
+        incremental = complete and (partial or not full_resync_due)
+
+        fetched = 0
+        # Новые видео инкрементальной синхронизации записываются в базу только вместе,
+        # когда дочитаны до известных: прерванная синхронизация не оставляет пропуска в истории
+        pending = []
+        # Прочитанные до перезапуска страницы полного чтения уже лежат в базе
+        resumable = not incremental and not partial
+        next_page_token = None
+        pass_started_at = time.time()
+        if resumable:
+            next_page_token = await asyncio.to_thread(self.video_store.get_resume_token, channel_id)
+            if next_page_token and state['pass_started_at']:
+                pass_started_at = state['pass_started_at']
+            else:
+                next_page_token = None
+                pass_started_at = await asyncio.to_thread(self.video_store.start_full_pass, channel_id)
+        while True:
+            try:
+                response = await self._list_uploads(
+                    channel_id,
+                    part="snippet,contentDetails",
+                    maxResults=50,
+                    pageToken=next_page_token
+                )
+            except HttpError as e:
+                if not (resumable and fetched == 0 and next_page_token and e.resp.status == 400):
+                    raise
+                # Сохраненный токен устарел — читаем плейлист с начала
+                await asyncio.to_thread(self.video_store.set_resume_token, channel_id, None)
+                pass_started_at = await asyncio.to_thread(self.video_store.start_full_pass, channel_id)
+                next_page_token = None
+                continue
+            videos = [self._playlist_item_to_video(item) for item in response.get('items', [])]
+            next_page_token = response.get('nextPageToken')
+            fetched += len(videos)
+
+            if incremental:
+                known = await asyncio.to_thread(
+                    self.video_store.known_ids, channel_id, [v['video_id'] for v in videos]
+                )
+                pending.extend(videos)
+                if videos and next_page_token and not known:
+                    await asyncio.sleep(0.05)
+                    continue
+                await asyncio.to_thread(self.video_store.upsert_videos, channel_id, pending)
+                if on_progress:
+                    await on_progress(fetched)
+                break
+
+            if not videos:
+                break
+            await asyncio.to_thread(self.video_store.upsert_videos, channel_id, videos)
+            if on_progress:
+                await on_progress(fetched)
+            if resumable:
+                await asyncio.to_thread(self.video_store.set_resume_token, channel_id, next_page_token)
+            if not next_page_token:
+                break
+            # Частичная синхронизация: историю не помечаем полной
+            if (min_items and fetched >= min_items) or (since and videos[-1]['published_at'] < since):
+                await asyncio.to_thread(self.video_store.set_sync_state, channel_id, complete=complete)
+                return fetched
+            await asyncio.sleep(0.05)
+
+        if not incremental:
+            # Плейлист прочитан целиком: видео, которых в нем не было, удалены или скрыты
+            await asyncio.to_thread(self.video_store.delete_unseen, channel_id, pass_started_at)
+        await asyncio.to_thread(self.video_store.set_sync_state, channel_id, complete=True, full=not incremental)
+        return fetched
+
     async def get_recent_video_stats(self, channel_id: str) -> dict:
         """
         Собирает статистику (просмотры, лайки, комменты)
@@ -187,18 +646,14 @@ class YouTubeAnalyzer:
         if not uploads_playlist_id:
             return {"error": "У канала нет плейлиста загрузок."}
 
-        request_videos = self.youtube.playlistItems().list(
-            part="contentDetails",
-            playlistId=uploads_playlist_id,
-            maxResults=10
-        )
-        response_videos = request_videos.execute()
-        video_ids = [item['contentDetails']['videoId'] for item in response_videos.get('items', [])]
+        await self.sync_channel_uploads(channel_id, min_items=10, max_age=VIDEO_STORE_FRESHNESS)
+        recent = await asyncio.to_thread(self.video_store.recent_videos, channel_id, 10)
+        video_ids = [video['video_id'] for video in recent]
 
         if not video_ids: return {"error": "На канале нет недавних видео."}
 
-        request_stats = self.youtube.videos().list(part="statistics", id=",".join(video_ids))
-        response_stats = request_stats.execute()
+        response_stats = await self._api('videos.list', part="statistics", id=",".join(video_ids))
+        await asyncio.to_thread(self.video_store.update_stats, response_stats.get('items', []))
 
         views_list, likes_list, comments_list = [], [], []
         for video_stat in response_stats.get('items', []):
@@ -211,9 +666,12 @@ class YouTubeAnalyzer:
 
         return {"views_list": views_list, "likes_list": likes_list, "comments_list": comments_list}
 
-    async def analyze_channel(self, channel_input: str) -> dict | None:
+    async def analyze_channel(self, channel_input: str, fields: set | None = None) -> dict | None:
         """
         Получает и обрабатывает ГЛУБОКУЮ статистику для конкретного канала.
+        fields — набор нужных полей результата (например, {'title', 'video_count'}).
+        Запросы к API выполняются только для запрошенных полей; channel_id и url есть всегда.
+        По умолчанию собираются все поля, включая "здоровье" по последним видео.
         """
         channel_info = self._extract_channel_info(channel_input)
         if not channel_input or not isinstance(channel_input, str):
@@ -228,53 +686,63 @@ class YouTubeAnalyzer:
             return {
                 "error": "Не удалось распознать формат. Введите ссылку на канал, псевдоним (@vdud) или просто название."}
 
+        # Проверяем формат ID канала / имени пользователя / поискового запроса
+        max_length = 100 if channel_info['type'] in ('handle', 'custom', 'search_query') else 50
+        if not isinstance(channel_info['value'], str) or len(channel_info['value']) > max_length:
+            return {"error": "Неверный формат ID канала или поискового запроса."}
+
+        channel_id = await self._resolve_channel_id(channel_info)
+        if not channel_id:
+            if channel_info['type'] in ('id', 'username'):
+                return {"error": "Канал не найден или недоступен."}
+            return {"error": f"Не удалось найти канал по имени '{channel_info['value']}'. "}
+
+        if fields is None:
+            fields = CHANNEL_SNIPPET_FIELDS | CHANNEL_STATISTICS_FIELDS | CHANNEL_HEALTH_FIELDS
+        parts = []
+        if fields & CHANNEL_SNIPPET_FIELDS: parts.append("snippet")
+        if fields & CHANNEL_STATISTICS_FIELDS: parts.append("statistics")
+        with_health = bool(fields & CHANNEL_HEALTH_FIELDS)
+
+        return await self._singleflight.do(
+            f"channel:{channel_id}:{','.join(parts)}:{with_health}",
+            lambda: self._analyze_channel_by_id(channel_id, parts, with_health)
+        )
+
+    async def _analyze_channel_by_id(self, channel_id: str, parts: list, with_health: bool) -> dict:
         try:
-            request_args = {"part": "snippet,statistics"}
-            channel_id = None
-            if channel_info['type'] == 'id':
-                # Проверяем формат ID канала
-                if not isinstance(channel_info['value'], str) or len(channel_info['value']) > 50:
-                    return {"error": "Неверный формат ID канала."}
-                request_args['id'] = channel_info['value']
-                channel_id = channel_info['value']
-            elif channel_info['type'] == 'username':
-                # Проверяем формат имени пользователя
-                if not isinstance(channel_info['value'], str) or len(channel_info['value']) > 50:
-                    return {"error": "Неверный формат имени пользователя."}
-                request_args['forUsername'] = channel_info['value']
-            elif channel_info['type'] == 'search_query':
-                # Проверяем формат поискового запроса
-                if not isinstance(channel_info['value'], str) or len(channel_info['value']) > 100:
-                    return {"error": "Неверный формат поискового запроса."}
-                channel_id = await self._get_channel_id_by_search(channel_info['value'])
-                if not channel_id:
-                    return {"error": f"Не удалось найти канал по имени '{channel_info['value']}'. "}
-                request_args['id'] = channel_id
-
-            request = self.youtube.channels().list(**request_args)
-            response = request.execute()
+            # Даже если нужны только вычисляемые поля, проверяем, что канал существует
+            response = await self._api('channels.list', part=",".join(parts) or "id", id=channel_id)
             if not response.get('items'): return {"error": "Канал не найден или недоступен."}
 
             item = response['items'][0]
-            snippet, stats = item['snippet'], item.get('statistics', {})
-            if not channel_id: channel_id = item['id']
-
-            # Очищаем и валидируем полученные данные
-            title = snippet['title'] if isinstance(snippet['title'], str) else 'N/A'
-            title = title[:200] if len(title) > 200 else title  # Ограничиваем длину названия
-
             data = {
-                "channel_id": channel_id, "title": title,
-                "url": f"https://www.youtube.com/channel/{channel_id}",
-                "published_at": snippet['publishedAt'],
-                "video_count": stats.get('videoCount', '0'),
-                "view_count": stats.get('viewCount', '0'),
-                "subscriber_count": stats.get('subscriberCount', '0')
+                "channel_id": channel_id,
+                "url": f"https://www.youtube.com/channel/{channel_id}"
             }
 
+            if "snippet" in parts:
+                snippet = item['snippet']
+                # Очищаем и валидируем полученные данные
+                title = snippet['title'] if isinstance(snippet['title'], str) else 'N/A'
+                title = title[:200] if len(title) > 200 else title  # Ограничиваем длину названия
+                data['title'] = title
+                data['published_at'] = snippet['publishedAt']
+
+            if "statistics" in parts:
+                stats = item.get('statistics', {})
+                data['video_count'] = stats.get('videoCount', '0')
+                data['view_count'] = stats.get('viewCount', '0')
+                data['subscriber_count'] = stats.get('subscriberCount', '0')
+
+            if not with_health:
+                return data
+
             health_data = await self.get_recent_video_stats(channel_id)
 
             if 'error' not in health_data:
+                # Сырые списки нужны для графика активности без повторного запроса
+                data['recent_stats'] = health_data
                 num_videos = len(health_data['views_list'])
                 total_views = sum(health_data['views_list'])
                 total_likes = sum(health_data['likes_list'])
@@ -297,22 +765,16 @@ class YouTubeAnalyzer:
             if not uploads_playlist_id:
                 return {"error": "У канала нет плейлиста загрузок."}
 
-            request_videos = self.youtube.playlistItems().list(
-                part="snippet",
-                playlistId=uploads_playlist_id,
-                maxResults=50
-            )
-            response_videos = request_videos.execute()
-
-            items = response_videos.get('items', [])
-            if not items:
+            await self.sync_channel_uploads(channel_id, min_items=50, max_age=VIDEO_STORE_FRESHNESS)
+            videos = await asyncio.to_thread(self.video_store.recent_videos, channel_id, 50)
+            if not videos:
                 return {"error": "На канале нет недавних видео."}
 
             grid = np.zeros((7, 24), dtype=int)
             day_map = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
 
-            for item in items:
-                pub_str = item['snippet']['publishedAt']
+            for video in videos:
+                pub_str = video['published_at']
                 dt = datetime.datetime.fromisoformat(pub_str.replace('Z', '+00:00'))
                 weekday = dt.weekday()
                 hour = dt.hour
@@ -336,90 +798,105 @@ class YouTubeAnalyzer:
             return {"error": f"Ошибка при сборе данных для теплокарты: {e}"}
 
     # ⭐️⭐️⭐️ ФУНКЦИЯ ДЛЯ EXCEL ⭐️⭐️⭐️
-    async def get_most_popular_video_in_range(self, channel_id: str, days_ago: int) -> str:
+    async def get_top_videos_by_windows(self, channel_id: str, windows: tuple = (7, 14, 30)) -> dict:
+        """
+        Самое просматриваемое видео канала за каждый из периодов (в днях).
+        Вместо search.list (100 единиц на период) за один проход синхронизирует плейлист
+        загрузок до самого длинного периода и добирает статистику пачками по 50 ID.
+        Возвращает {дни: ссылка на видео | "N/A" | "Ошибка API"}.
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cutoff = now - datetime.timedelta(days=max(windows))
         try:
-            start_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_ago)
-            published_after = start_date.isoformat()
-            request = self.youtube.search().list(
-                part="snippet", channelId=channel_id,
-                publishedAfter=published_after, order="viewCount",
-                type="video", maxResults=1
-            )
-            response = request.execute()
-            if response.get('items'):
-                video_id = response['items'][0]['id']['videoId']
-                return f"https://youtu.be/{video_id}"
-            else:
-                return "N/A"
+            if not await self._get_uploads_playlist_id(channel_id):
+                return {days: "N/A" for days in windows}
+
+            # 1. Видео, опубликованные за самый длинный период
+            since = cutoff.strftime("%Y-%m-%dT%H:%M:%SZ")
+            await self.sync_channel_uploads(channel_id, since=since)
+            published = {}
+            for video in await asyncio.to_thread(self.video_store.recent_videos, channel_id, limit=5000, since=since):
+                published[video['video_id']] = datetime.datetime.fromisoformat(
+                    video['published_at'].replace('Z', '+00:00')
+                )
+
+            # 2. Просмотры пачками по 50 ID
+            video_ids = list(published)
+            views = {}
+            for i in range(0, len(video_ids), 50):
+                response = await self._api('videos.list', part="statistics", id=",".join(video_ids[i:i + 50]))
+                await asyncio.to_thread(self.video_store.update_stats, response.get('items', []))
+                for item in response.get('items', []):
+                    views[item['id']] = int(item.get('statistics', {}).get('viewCount', 0))
+
+            # 3. Лучшее видео в каждом окне
+            result = {}
+            for days in windows:
+                window_start = now - datetime.timedelta(days=days)
+                in_window = [vid for vid, dt in published.items() if dt >= window_start and vid in views]
+                if in_window:
+                    best_id = max(in_window, key=views.get)
+                    result[days] = f"https://youtu.be/{best_id}"
+                else:
+                    result[days] = "N/A"
+            return result
         except Exception:
-            return "Ошибка API"
+            return {days: "Ошибка API" for days in windows}
+
+    async def get_most_popular_video_in_range(self, channel_id: str, days_ago: int) -> str:
+        result = await self.get_top_videos_by_windows(channel_id, (days_ago,))
+        return result[days_ago]
 
     # ⭐️⭐️⭐️ НОВАЯ ФУНКЦИЯ: СБОР ВСЕХ НАЗВАНИЙ ⭐️⭐️⭐️
-    async def get_all_video_titles(self, channel_input: str) -> dict:
+    async def resolve_channel(self, channel_input: str) -> dict:
         """
-        Собирает названия ВСЕХ видео с канала через пагинацию.
-        Возвращает список строк (названий).
+        Определяет ID канала по ссылке/псевдониму и проверяет наличие плейлиста загрузок.
+        Возвращает {"channel_id": ...} или {"error": ...}.
         """
-        # 1. Получаем ID канала
         channel_info = self._extract_channel_info(channel_input)
         if not channel_info:
             return {"error": "Неверная ссылка или ID канала."}
 
-        channel_id = None
-        if channel_info['type'] == 'id':
-            channel_id = channel_info['value']
-        else:
-            try:
-                if channel_info['type'] == 'username':
-                    req = self.youtube.channels().list(part="id", forUsername=channel_info['value'])
-                    resp = req.execute()
-                    if resp.get('items'):
-                        channel_id = resp['items'][0]['id']
-                
-                # Если не нашли по username или это search query
-                if not channel_id:
-                    channel_id = await self._get_channel_id_by_search(channel_info['value'])
-            except Exception as e:
-                return {"error": f"Ошибка поиска канала: {e}"}
-
+        channel_id = await self._resolve_channel_id(channel_info)
         if not channel_id:
             return {"error": "Канал не найден."}
 
-        # 2. Получаем ID плейлиста "Uploads"
-        uploads_id = await self._get_uploads_playlist_id(channel_id)
-        if not uploads_id:
+        if not await self._get_uploads_playlist_id(channel_id):
             return {"error": "Не удалось найти плейлист загрузок."}
+        return {"channel_id": channel_id}
+
+    async def iter_video_title_pages(self, channel_id: str, on_progress=None):
+        """
+        Асинхронный генератор: отдает названия видео канала постранично.
+        Сначала дочитывает новые загрузки в локальную базу (см. sync_channel_uploads),
+        затем читает названия из базы страницами, не держа весь список в памяти.
+        Ошибки API пробрасываются вызывающему.
+        """
+        await self.sync_channel_uploads(channel_id, on_progress=on_progress)
+        # Каждая страница читается из базы в потоке, чтобы не блокировать event loop
+        pages = self.video_store.iter_video_pages(channel_id)
+        while (videos := await asyncio.to_thread(next, pages, None)) is not None:
+            yield [video['title'] for video in videos]
+
+    async def get_all_video_titles(self, channel_input: str) -> dict:
+        """
+        Собирает названия ВСЕХ видео с канала через пагинацию.
+        Возвращает список строк (названий).
+        Для больших каналов лучше использовать iter_video_title_pages.
+        """
+        admission_error = self.check_admission('titles_export')
+        if admission_error:
+            return {"error": admission_error}
+
+        channel = await self.resolve_channel(channel_input)
+        if channel.get("error"):
+            return channel
+        channel_id = channel['channel_id']
 
-        # 3. Цикл по всем страницам (Pagination)
         all_titles = []
-        next_page_token = None
-        
         try:
-            while True:
-                request = self.youtube.playlistItems().list(
-                    part="snippet",
-                    playlistId=uploads_id,
-                    maxResults=50, # Максимум за 1 запрос
-                    pageToken=next_page_token
-                )
-                response = request.execute()
-                
-                items = response.get('items', [])
-                if not items:
-                    break
-
-                for item in items:
-                    title = item['snippet']['title']
-                    all_titles.append(title)
-
-                next_page_token = response.get('nextPageToken')
-                
-                # Если токена следующей страницы нет, мы дошли до конца
-                if not next_page_token:
-                    break
-                    
-                # Маленькая пауза
-                await asyncio.sleep(0.05)
+            async for titles in self.iter_video_title_pages(channel_id):
+                all_titles.extend(titles)
 
             # Получаем название канала для имени файла (опционально, доп. запрос)
             channel_title = f"Channel_{channel_id}"
@@ -435,103 +912,77 @@ class YouTubeAnalyzer:
     # ⭐️⭐️⭐️ НОВАЯ ФУНКЦИЯ: СКАЧИВАНИЕ ПРЕВЬЮ В ZIP ⭐️⭐️⭐️
     async def download_thumbnails_zip(self, channel_input: str, limit: int) -> dict:
         """
-        Скачивает N последних превью с канала и упаковывает их в ZIP-архив в памяти.
+        Скачивает N последних превью с канала и упаковывает их в ZIP-архив.
+        Превью качаются параллельно (не больше THUMB_DOWNLOAD_CONCURRENCY одновременно),
+        начиная уже с первой прочитанной страницы плейлиста. JPEG не сжимается повторно,
+        поэтому файлы пишутся в архив без сжатия; архив собирается в SpooledTemporaryFile
+        и при большом объеме уходит на диск.
         """
-        # 1. Получаем ID канала
-        channel_info = self._extract_channel_info(channel_input)
-        if not channel_info:
-            return {"error": "Неверная ссылка или ID канала."}
-
-        channel_id = None
-        # Логика определения ID (копируем из get_all_video_titles или вызываем helper)
-        if channel_info['type'] == 'id':
-            channel_id = channel_info['value']
-        else:
+        admission_error = self.check_admission('thumbnails_zip')
+        if admission_error:
+            return {"error": admission_error}
+
+        # 1. Получаем ID канала и проверяем плейлист загрузок
+        channel = await self.resolve_channel(channel_input)
+        if channel.get("error"):
+            return channel
+        channel_id = channel['channel_id']
+
+        # 2. Подготовка к скачиванию
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        zip_file = zipfile.ZipFile(spool, "w", zipfile.ZIP_STORED)
+        semaphore = asyncio.Semaphore(THUMB_DOWNLOAD_CONCURRENCY)
+        scheduled: set[str] = set()
+        tasks = []
+
+        async def fetch_thumbnail(position: int, video: dict):
+            # Получаем URL лучшего качества
+            thumb_url = self._get_best_thumbnail_url(video['thumbnails'])
+            if not thumb_url:
+                return
+            # Качество — имя файла в URL (maxresdefault, hqdefault, ...), по нему превью ищется в кэше
+            quality = thumb_url.rsplit('/', 1)[-1].split('.')[0]
             try:
-                if channel_info['type'] == 'username':
-                    req = self.youtube.channels().list(part="id", forUsername=channel_info['value'])
-                    resp = req.execute()
-                    if resp.get('items'):
-                        channel_id = resp['items'][0]['id']
-                if not channel_id:
-                    channel_id = await self._get_channel_id_by_search(channel_info['value'])
-            except Exception as e:
-                return {"error": f"Ошибка поиска канала: {e}"}
-
-        if not channel_id:
-            return {"error": "Канал не найден."}
-
-        # 2. Получаем ID плейлиста "Uploads"
-        uploads_id = await self._get_uploads_playlist_id(channel_id)
-        if not uploads_id:
-            return {"error": "Не удалось найти плейлист загрузок."}
+                async with semaphore:
+                    data = await thumbnail_cache.fetch(video['video_id'], quality, thumb_url)
+            except Exception:
+                return  # Пропускаем, если картинка битая
+            if data is None:
+                return
+            # Очищаем название файла от недопустимых символов
+            safe_title = "".join([c for c in video['title'] if c.isalpha() or c.isdigit() or c == ' ']).strip()
+            safe_title = safe_title[:50]  # Обрезаем, если слишком длинное
+            # Запись идет из event loop без await, поэтому задачи не пишут в архив одновременно
+            zip_file.writestr(f"{position:03d}_{safe_title}.jpg", data)
+
+        def schedule(videos: list):
+            for position, video in enumerate(videos, 1):
+                if video['video_id'] not in scheduled:
+                    scheduled.add(video['video_id'])
+                    tasks.append(asyncio.create_task(fetch_thumbnail(position, video)))
+
+        async def on_page(fetched: int):
+            # Видео с уже прочитанных страниц начинают качаться, пока читается следующая
+            schedule(await asyncio.to_thread(self.video_store.recent_videos, channel_id, min(fetched, limit)))
 
-        # 3. Подготовка к скачиванию
-        zip_buffer = io.BytesIO()
-        next_page_token = None
-        videos_processed = 0
-
-        # Создаем ZIP файл в памяти
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            try:
-                while videos_processed < limit:
-                    # Вычисляем сколько осталось скачать
-                    remaining = limit - videos_processed
-                    # MaxResults API = 50. Берем минимум между 50 и остатком.
-                    fetch_count = min(50, remaining)
-
-                    request = self.youtube.playlistItems().list(
-                        part="snippet",
-                        playlistId=uploads_id,
-                        maxResults=fetch_count,
-                        pageToken=next_page_token
-                    )
-                    response = request.execute()
-
-                    items = response.get('items', [])
-                    if not items:
-                        break
-
-                    # Асинхронно скачиваем картинки для текущей пачки
-                    for item in items:
-                        snippet = item['snippet']
-                        title = snippet['title']
-                        # Очищаем название файла от недопустимых символов
-                        safe_title = "".join([c for c in title if c.isalpha() or c.isdigit() or c == ' ']).strip()
-                        safe_title = safe_title[:50]  # Обрезаем, если слишком длинное
-
-                        # Получаем URL лучшего качества
-                        thumb_url = self._get_best_thumbnail_url(snippet.get('thumbnails', {}))
-
-                        if thumb_url:
-                            # Скачиваем байты картинки
-                            try:
-                                r = await self.ryd_client.get(thumb_url)  # Используем существующий клиент httpx
-                                if r.status_code == 200:
-                                    # Добавляем в архив: имя файла, данные
-                                    file_name = f"{videos_processed + 1:03d}_{safe_title}.jpg"
-                                    zip_file.writestr(file_name, r.content)
-                            except Exception:
-                                pass  # Пропускаем, если картинка битая
-
-                        videos_processed += 1
-                        if videos_processed >= limit:
-                            break
-
-                    next_page_token = response.get('nextPageToken')
-                    if not next_page_token:
-                        break
-
-                    await asyncio.sleep(0.05)
-
-            except Exception as e:
-                return {"error": f"Ошибка при скачивании: {e}"}
-
-        # Возвращаем буфер, перемотанный в начало
-        zip_buffer.seek(0)
+        try:
+            # Список последних видео берем из локальной базы, дочитав новые загрузки
+            await self.sync_channel_uploads(channel_id, min_items=limit, on_progress=on_page)
+            schedule(await asyncio.to_thread(self.video_store.recent_videos, channel_id, limit))
+            await asyncio.gather(*tasks)
+        except Exception as e:
+            for task in tasks:
+                task.cancel()
+            zip_file.close()
+            spool.close()
+            return {"error": f"Ошибка при скачивании: {e}"}
+
+        zip_file.close()
+        # Возвращаем файл, перемотанный в начало
+        spool.seek(0)
         safe_channel_name = f"thumbnails_{channel_id}"
         return {
-            "buffer": zip_buffer,
+            "buffer": spool,
             "filename": f"{safe_channel_name}.zip",
-            "count": videos_processed
-        }
\ No newline at end of file
+            "count": len(scheduled)
+        }